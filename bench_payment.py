@@ -0,0 +1,125 @@
+import argparse
+import statistics
+import threading
+import time
+import uuid
+
+import src.fake_mercadopago as fake_mercadopago
+import src.mercadopago_client as mercadopago_client
+import src.payment as payment
+import src.sale as sale
+
+PAYMENT_TYPES = {"Cartão": "", "Débito": "Débito", "Crédito": "Crédito", "Pix": "Pix"}
+
+
+class ImmediateEvents:
+    """Sem Tk não há fila a drenar: os eventos rodam na própria thread que os posta."""
+
+    def post(self, callback, *args, key=None):
+        callback(*args)
+
+
+class HeadlessApp:
+    """Faz o papel do POSApplication: só registra status e o fim da venda."""
+
+    scale_factor = 1.0
+
+    def __init__(self):
+        self.ui_events = ImmediateEvents()
+        self.statuses = []
+        self.done = threading.Event()
+        self.result = None
+
+    def reset(self):
+        """Prepara para a próxima cobrança (o mesmo app/Payment serve o benchmark inteiro)."""
+        self.statuses = []
+        self.result = None
+        self.done.clear()
+
+    def update_status(self, status):
+        self.statuses.append(status)
+        if status in ("CANCELED", "ABANDONED", "ERROR", "Substituído", "Tempo esgotado", "Falha"):
+            self.result = status
+            self.done.set()
+
+    def finalize_sale(self, internal_id):
+        self.result = "FINISHED"
+        self.done.set()
+
+
+class HeadlessQRWindow:
+    def hide(self, internal_id=None):
+        pass
+
+
+class HeadlessPayment(payment.Payment):
+    """Payment sem janela de QR, para rodar o fluxo Pix sem Tk."""
+
+    def create_qr_window(self):
+        return HeadlessQRWindow()
+
+    def display_qr_code(self, qr_data, internal_id):
+        self.track_pix(internal_id)
+
+
+def build_payment(fake, poll_interval, max_poll_interval):
+    """Um app, um cliente e um Payment (com uma única thread de monitor) para todas as execuções."""
+    app = HeadlessApp()
+    client = mercadopago_client.MercadoPagoClient("TEST", "DEVICE", "USER", "POS", base_url=fake.base_url)
+    pay = HeadlessPayment(app, "Benchmark", client=client)
+    pay.poll_interval = poll_interval
+    pay.max_poll_interval = max_poll_interval
+    return app, pay
+
+
+def run_charge(fake, app, pay, payment_type, amount, timeout):
+    app.reset()
+    internal_id = str(uuid.uuid4())
+    requests_before = fake.total_requests()
+    start = time.perf_counter()
+    pay.payment(sale.to_cents(amount), payment_type, internal_id)
+    finished = app.done.wait(timeout)
+    elapsed = time.perf_counter() - start
+    requests_used = fake.total_requests() - requests_before
+    if not finished:
+        pay.cancel(internal_id)  # Não deixa a cobrança sendo consultada durante as próximas execuções
+    return elapsed, requests_used, app.result if finished else "TIMEOUT"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de uma cobrança de ponta a ponta contra o Mercado Pago falso.")
+    parser.add_argument("--tipos", nargs="+", default=list(PAYMENT_TYPES), choices=list(PAYMENT_TYPES))
+    parser.add_argument("--execucoes", type=int, default=3, help="Cobranças por tipo")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Segundos por resposta do servidor falso")
+    parser.add_argument("--resultado", default="FINISHED", choices=["FINISHED", "CANCELED", "ABANDONED"])
+    parser.add_argument("--pix-pago-apos", type=float, default=2.0)
+    parser.add_argument("--intervalo", type=float, default=payment.Payment.poll_interval,
+                        help="Intervalo mínimo entre consultas de status")
+    parser.add_argument("--intervalo-max", type=float, default=payment.Payment.max_poll_interval)
+    parser.add_argument("--valor", type=float, default=12.5)
+    args = parser.parse_args()
+
+    fake = fake_mercadopago.FakeMercadoPago(latency=args.latencia, card_outcome=args.resultado,
+                                            pix_pay_after=args.pix_pago_apos)
+    fake.start()
+    app, pay = build_payment(fake, args.intervalo, args.intervalo_max)
+    try:
+        print(f"{'Tipo':<10}{'Resultado':<12}{'Tempo médio (s)':>16}{'Máx (s)':>10}{'Requisições':>13}")
+        for name in args.tipos:
+            times, counts, results = [], [], set()
+            for _ in range(args.execucoes):
+                elapsed, requests_used, result = run_charge(
+                    fake, app, pay, PAYMENT_TYPES[name], args.valor, timeout=60)
+                times.append(elapsed)
+                counts.append(requests_used)
+                results.add(result)
+            print(f"{name:<10}{'/'.join(sorted(results)):<12}{statistics.mean(times):>16.2f}"
+                  f"{max(times):>10.2f}{statistics.mean(counts):>13.1f}")
+        print("\nRequisições por rota:", dict(fake.requests))
+    finally:
+        pay.client.close()
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import src.startup_profile as startup_profile
+
 import tkinter as tk
-import src.gui as gui
+
+with startup_profile.phase("imports"):
+    import src.gui as gui
 
 if __name__ == "__main__":
     root = tk.Tk()
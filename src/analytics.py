@@ -0,0 +1,141 @@
+import argparse
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import src.promotions as promotions
+import src.sale as sale
+import src.sales_journal as journal
+
+CACHE_VERSION = 2  # Muda quando o cálculo de prepare_items muda (o cache antigo é descartado)
+
+# Nome na linha de comando -> coluna do DataFrame de linhas vendidas
+DIMENSIONS = {
+    'categoria': 'categoria',
+    'sabor': 'sabor',
+    'loja': 'loja',
+    'pagamento': 'metodo_pagamento',
+    'dia': 'data',
+    'hora': 'hora',
+}
+
+
+def load_history(journal_path='Files/Historico_vendas.db', cache_path='Files/.cache/analytics_history.pkl'):
+    """Linhas vendidas com receita já calculada, lidas do diário de forma incremental.
+
+    O resultado fica em cache (pickle) junto com o id da última venda lida;
+    na próxima chamada só as vendas novas são lidas e preparadas.
+    """
+    cached, last_row = None, 0
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+            if cache.get('journal') == os.path.abspath(journal_path) and cache.get('version') == CACHE_VERSION:
+                cached, last_row = cache['items'], cache['last_row']
+        except Exception as e:
+            print(f"Ignorando cache de análises inválido: {e}")
+
+    sales_journal = journal.SalesJournal(journal_path, legacy_xlsx=None)
+    try:
+        current_last_row = sales_journal.last_sale_row()
+        if current_last_row < last_row:
+            # Diário foi recriado: descarta o cache
+            cached, last_row = None, 0
+        if cached is not None and current_last_row == last_row:
+            return cached
+        new_items = prepare_items(sales_journal.read_items(after_sale_row=last_row))
+    finally:
+        sales_journal.close()
+
+    items = new_items if cached is None else pd.concat([cached, new_items], ignore_index=True)
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump({'journal': os.path.abspath(journal_path), 'version': CACHE_VERSION,
+                         'last_row': current_last_row, 'items': items}, f)
+    return items
+
+
+def prepare_items(items):
+    """Calcula, de uma vez para todas as linhas, o preço efetivo (com promoção) e a receita.
+
+    Vendas novas já trazem o preço cobrado (`preco_cobrado`); só as antigas
+    recalculam a promoção, com os métodos elegíveis da loja da venda.
+    """
+    items = items.copy()
+    items['loja'] = items['loja'].fillna('')
+    items['metodo_pagamento'] = items['metodo_pagamento'].fillna('')
+    items['categoria'] = items['categoria'].fillna('')
+    items['sabor'] = items['sabor'].fillna('')
+    items['quantidade'] = items['quantidade'].fillna(0).astype(int)
+    if 'preco_cobrado' not in items.columns:
+        items['preco_cobrado'] = np.nan
+    for column in ('preco', 'promo_preco', 'promo_qt', 'preco_cobrado'):
+        items[column] = pd.to_numeric(items[column], errors='coerce')
+    items['hora'] = items['horario'].str.slice(0, 2)
+
+    # Mesma regra de Sale.apply_promotion: quantidade da categoria na venda >= promo_qt
+    category_quantity = items.groupby(['sale_id', 'categoria'])['quantidade'].transform('sum')
+    # Elegibilidade do método de pagamento por loja, como em PromotionRules
+    eligible = items['metodo_pagamento'].isin(sale.PROMO_PAYMENT_METHODS)
+    for loja, methods in promotions.SHOP_PROMO_METHODS.items():
+        eligible = eligible.where(items['loja'] != loja, items['metodo_pagamento'].isin(methods))
+    promo = (
+            eligible &
+            items['promo_qt'].notna() &
+            (category_quantity >= items['promo_qt'])
+    )
+    preco = items['preco'].fillna(0.0)
+    recalculated = np.where(promo, items['promo_preco'].fillna(preco), preco)
+    items['preco_efetivo'] = items['preco_cobrado'].fillna(pd.Series(recalculated, index=items.index))
+    items['receita'] = items['preco_efetivo'] * items['quantidade']
+
+    # Categorias com espaço sobrando ("Casquinha ") contam junto nos relatórios
+    items['categoria'] = items['categoria'].str.strip()
+    items['sabor'] = items['sabor'].str.strip()
+    return items
+
+
+def report(items, by=('categoria',), date_from=None, date_to=None, contains=None):
+    """Quantidade e receita agrupadas pelas dimensões pedidas, em uma passada."""
+    mask = pd.Series(True, index=items.index)
+    if date_from:
+        mask &= items['data'] >= date_from
+    if date_to:
+        mask &= items['data'] <= date_to
+    if contains:
+        mask &= items['categoria'].str.contains(contains, case=False, regex=False)
+
+    columns = [DIMENSIONS[dimension] for dimension in by]
+    result = items[mask].groupby(columns)[['quantidade', 'receita']].sum()
+    return result.sort_values('receita', ascending=False)
+
+
+def category_quantity(items, term):
+    """Total vendido das categorias que contêm `term` (ex.: 'doki')."""
+    return int(items.loc[items['categoria'].str.contains(term, case=False, regex=False), 'quantidade'].sum())
+
+
+if __name__ == "__main__":
+    # python -m src.analytics --por categoria sabor --de 2025-01-01 --ate 2025-01-31
+    parser = argparse.ArgumentParser(description="Relatórios de vendas (quantidade e receita).")
+    parser.add_argument('--por', nargs='+', default=['categoria'], choices=list(DIMENSIONS),
+                        help="Dimensões de agrupamento")
+    parser.add_argument('--de', dest='date_from', help="Data inicial (AAAA-MM-DD)")
+    parser.add_argument('--ate', dest='date_to', help="Data final (AAAA-MM-DD)")
+    parser.add_argument('--categoria', dest='contains', help="Só categorias que contêm este texto")
+    parser.add_argument('--diario', default='Files/Historico_vendas.db', help="Arquivo do diário de vendas")
+    parser.add_argument('--csv', help="Salvar o relatório em CSV")
+    args = parser.parse_args()
+
+    history = load_history(args.diario)
+    result = report(history, by=args.por, date_from=args.date_from, date_to=args.date_to, contains=args.contains)
+    if args.csv:
+        result.to_csv(args.csv)
+    with pd.option_context('display.max_rows', None, 'display.float_format', '{:.2f}'.format):
+        print(result)
+        print(f"\nTotal: {result['quantidade'].sum()} itens, R${result['receita'].sum():.2f}")
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import zipfile
+from xml.etree import ElementTree
+
+# Só biblioteca padrão: a janela de lojas abre sem importar pandas/openpyxl (que ainda puxa o PIL)
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def read_shops(filepath):
+    """Nomes das lojas do catálogo sem carregá-lo (lista vazia se não der para ler)."""
+    try:
+        if os.path.splitext(filepath)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+            return sqlite_shops(filepath)
+        return xlsx_shops(filepath)
+    except Exception as e:
+        print(f"Não foi possível ler as lojas do cabeçalho: {e}")
+        return []
+
+
+def sqlite_shops(filepath):
+    conn = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in conn.execute("SELECT name FROM shops ORDER BY position, name")]
+    finally:
+        conn.close()
+
+
+def first_sheet_path(archive):
+    """Caminho da primeira planilha do arquivo (a mesma que o read_excel lê)."""
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find(f'{MAIN_NS}sheets/{MAIN_NS}sheet')
+    rel_id = sheet.get(f'{REL_NS}id')
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{PACKAGE_REL_NS}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    return 'xl/worksheets/sheet1.xml'
+
+
+def xlsx_first_row(filepath):
+    """Valores da linha 1 da primeira planilha, lendo só o começo do XML."""
+    with zipfile.ZipFile(filepath) as archive:
+        cells = []  # (tipo, valor bruto)
+        with archive.open(first_sheet_path(archive)) as sheet:
+            for event, element in ElementTree.iterparse(sheet):
+                if element.tag == f'{MAIN_NS}c':
+                    cell_type = element.get('t')
+                    if cell_type == 'inlineStr':
+                        value = ''.join(t.text or '' for t in element.iter(f'{MAIN_NS}t'))
+                    else:
+                        v = element.find(f'{MAIN_NS}v')
+                        value = v.text if v is not None else None
+                    cells.append((cell_type, value))
+                elif element.tag == f'{MAIN_NS}row':
+                    break  # Fim da primeira linha
+
+        # Textos compartilhados: lê só até o maior índice usado no cabeçalho
+        needed = {int(value) for cell_type, value in cells if cell_type == 's' and value is not None}
+        strings = []
+        if needed and 'xl/sharedStrings.xml' in archive.namelist():
+            last = max(needed)
+            with archive.open('xl/sharedStrings.xml') as shared:
+                for event, element in ElementTree.iterparse(shared):
+                    if element.tag == f'{MAIN_NS}si':
+                        strings.append(''.join(t.text or '' for t in element.iter(f'{MAIN_NS}t')))
+                        element.clear()
+                        if len(strings) > last:
+                            break
+
+    values = []
+    for cell_type, value in cells:
+        if cell_type == 's' and value is not None:
+            index = int(value)
+            value = strings[index] if index < len(strings) else None
+        values.append(value)
+    return values
+
+
+def xlsx_shops(filepath):
+    """Lojas do nível 0 do cabeçalho; a ordem segue a do load (alfabética)."""
+    # Cabeçalhos mesclados deixam células vazias
+    names = {str(value).strip() for value in xlsx_first_row(filepath) if value is not None}
+    return sorted(name for name in names if name and name not in ('Todas', 'Metadata')
+                  and not name.startswith('Unnamed'))
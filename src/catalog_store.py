@@ -0,0 +1,597 @@
+import atexit
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+from openpyxl import load_workbook, Workbook
+
+import src.catalog_header as catalog_header
+
+BASE_COLUMNS = ['Codigo de Barras', 'Categoria', 'Sabor']
+SHOP_COLUMNS = ['Preco', 'Promo Preco', 'Promo Quantidade']
+DATA_START_ROW = 3  # Linhas 1 e 2 são o cabeçalho MultiIndex
+
+
+def open_store(filepath):
+    """Escolhe o backend de armazenamento pela extensão do arquivo."""
+    if os.path.splitext(filepath)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteCatalogStore(filepath)
+    return ExcelCatalogStore(filepath)
+
+
+def file_digest(filepath):
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ExcelCatalogStore:
+    """Catálogo no layout original produtos.xlsx (cabeçalho de duas linhas).
+
+    O DataFrame lido da planilha fica em cache (pickle) em `cache_dir`,
+    junto com caminho, mtime, tamanho e hash do xlsx. Se mtime e tamanho
+    batem, o cache é usado direto; se só o mtime mudou, o hash confirma que
+    o conteúdo é o mesmo. A planilha só é lida de novo quando mudou de fato.
+    """
+
+    def __init__(self, filepath, cache_dir=None):
+        self.filepath = filepath
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(filepath) or '.', '.cache')
+        self.cache_path = os.path.join(cache_dir, os.path.basename(filepath) + '.pkl') if cache_dir else None
+
+    def load(self):
+        stat = os.stat(self.filepath)
+        cache = self.read_cache()
+        if cache is not None:
+            if cache['mtime'] == stat.st_mtime_ns and cache['size'] == stat.st_size:
+                return cache['df']
+            digest = file_digest(self.filepath)
+            if cache['size'] == stat.st_size and cache['sha1'] == digest:
+                self.write_cache(cache['df'], stat, digest)  # Só o mtime mudou (cópia, touch...)
+                return cache['df']
+        return self.refresh_cache()
+
+    def signature(self):
+        """(mtime, tamanho) da planilha, para perceber edições feitas fora do programa."""
+        stat = os.stat(self.filepath)
+        return stat.st_mtime_ns, stat.st_size
+
+    def shops(self):
+        """Nomes das lojas lidos só da linha de cabeçalho (sem carregar o catálogo)."""
+        return catalog_header.xlsx_shops(self.filepath)
+
+    def refresh_cache(self):
+        """Lê a planilha e regrava o cache. Retorna o DataFrame lido."""
+        stat = os.stat(self.filepath)
+        digest = file_digest(self.filepath)
+        df = pd.read_excel(self.filepath, header=[0, 1], dtype=str)
+        self.write_cache(df, stat, digest)
+        return df
+
+    def invalidate_cache(self):
+        """Descarta o cache depois de um save nosso; a próxima carga a frio lê a planilha e o refaz."""
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                os.remove(self.cache_path)
+            except OSError as e:
+                print(f"Não foi possível descartar o cache do catálogo: {e}")
+
+    def read_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cache = pickle.load(f)
+            if cache.get('path') == os.path.abspath(self.filepath):
+                return cache
+        except Exception as e:
+            print(f"Ignorando cache do catálogo inválido: {e}")
+        return None
+
+    def write_cache(self, df, stat, digest):
+        if not self.cache_path:
+            return
+        temp_path = None
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            # Nome temporário único: writer e watcher podem regravar o cache ao mesmo tempo
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+                temp_path = f.name
+                pickle.dump({'path': os.path.abspath(self.filepath), 'mtime': stat.st_mtime_ns,
+                             'size': stat.st_size, 'sha1': digest, 'df': df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Não foi possível gravar o cache do catálogo: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def save_products(self, entries):
+        """Grava uma lista de (product_info, shop) com um único load/save da planilha."""
+        try:
+            wb = load_workbook(self.filepath)
+            ws = wb.active
+        except FileNotFoundError:
+            wb = Workbook()
+            ws = wb.active
+            ws.title = "Produtos"
+            shop = entries[0][1]
+            headers = [("Todas", column) for column in BASE_COLUMNS] + [(shop, column) for column in SHOP_COLUMNS]
+            for col, (header1, header2) in enumerate(headers, start=1):
+                ws.cell(row=1, column=col, value=header1)
+                ws.cell(row=2, column=col, value=header2)
+
+        # Map headers to column indices
+        header_map = {
+            f"{ws.cell(row=1, column=col).value} {ws.cell(row=2, column=col).value}": col
+            for col in range(1, ws.max_column + 1)
+        }
+
+        for product_info, shop in entries:
+            excel_row = product_info.get('indexExcel', None)
+            if excel_row is None:
+                # Encontrar a próxima linha vazia para o código de barras
+                barcode_col = header_map.get("Todas Codigo de Barras")
+                excel_row = DATA_START_ROW
+                while ws.cell(row=excel_row, column=barcode_col).value:
+                    excel_row += 1
+
+            # Adicionar os dados na mesma linha
+            ws.cell(row=excel_row, column=header_map["Todas Codigo de Barras"], value=product_info['barcode'])
+            ws.cell(row=excel_row, column=header_map["Todas Sabor"], value=product_info['sabor'])
+            ws.cell(row=excel_row, column=header_map["Todas Categoria"], value=product_info['categoria'])
+
+            # Adicionar Preço
+            preco = product_info['preco']
+            ws.cell(row=excel_row, column=header_map[f"{shop} Preco"], value=float(preco))
+
+            # Adicionar Promo Preço, se disponível
+            promo_preco = product_info.get('promo_preco', None)
+            ws.cell(row=excel_row, column=header_map[f"{shop} Promo Preco"],
+                    value=float(promo_preco) if promo_preco is not None else "")
+
+            # Adicionar Promo Quantidade, se disponível
+            promo_qt = product_info.get('promo_qt', None)
+            ws.cell(row=excel_row, column=header_map[f"{shop} Promo Quantidade"],
+                    value=int(promo_qt) if promo_qt is not None else "")
+
+        wb.save(self.filepath)
+
+
+class SQLiteCatalogStore:
+    """Catálogo normalizado em SQLite: produtos + preços/promoções por loja.
+
+    A chave de cada produto continua sendo a linha do Excel (excel_row), para
+    que vendas, edições e o restante da aplicação não precisem mudar.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS products (
+                    excel_row INTEGER PRIMARY KEY,
+                    barcode TEXT,
+                    categoria TEXT,
+                    sabor TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_products_barcode ON products (barcode);
+                CREATE TABLE IF NOT EXISTS shops (
+                    name TEXT PRIMARY KEY,
+                    position INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS prices (
+                    excel_row INTEGER NOT NULL REFERENCES products (excel_row),
+                    shop TEXT NOT NULL REFERENCES shops (name),
+                    preco REAL,
+                    promo_preco REAL,
+                    promo_qt INTEGER,
+                    PRIMARY KEY (excel_row, shop)
+                );
+            """)
+
+    def signature(self):
+        """mtime/tamanho do banco e do WAL (onde ficam as gravações ainda não consolidadas)."""
+        signature = ()
+        for path in (self.filepath, self.filepath + '-wal'):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                signature += (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def shops(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT name FROM shops ORDER BY position, name")]
+
+    def load(self):
+        """Monta o mesmo DataFrame MultiIndex que o backend Excel produz."""
+        shops = self.shops()
+        with self.lock:
+            products = pd.read_sql_query(
+                "SELECT excel_row, barcode, categoria, sabor FROM products ORDER BY excel_row", self.conn
+            )
+            prices = pd.read_sql_query(
+                "SELECT excel_row, shop, preco, promo_preco, promo_qt FROM prices", self.conn
+            )
+
+        text_columns = ['barcode', 'categoria', 'sabor']
+        products[text_columns] = products[text_columns].where(products[text_columns].notna())
+
+        df = pd.DataFrame(index=products['excel_row'] - DATA_START_ROW)
+        df[('Todas', 'Codigo de Barras')] = products['barcode'].values
+        df[('Todas', 'Categoria')] = products['categoria'].values
+        df[('Todas', 'Sabor')] = products['sabor'].values
+
+        for shop in shops:
+            shop_prices = prices[prices['shop'] == shop].set_index('excel_row').reindex(products['excel_row'])
+            df[(shop, 'Preco')] = shop_prices['preco'].values
+            df[(shop, 'Promo Preco')] = shop_prices['promo_preco'].values
+            df[(shop, 'Promo Quantidade')] = shop_prices['promo_qt'].values
+
+        df.columns = pd.MultiIndex.from_tuples(df.columns)
+        df.index.name = None
+        return df
+
+    def save_products(self, entries):
+        """Grava uma lista de (product_info, shop) em uma única transação."""
+        with self.lock, self.conn:
+            for product_info, shop in entries:
+                excel_row = product_info.get('indexExcel', None)
+                if excel_row is None:
+                    last = self.conn.execute("SELECT MAX(excel_row) FROM products").fetchone()[0]
+                    excel_row = DATA_START_ROW if last is None else last + 1
+
+                self.conn.execute(
+                    "INSERT INTO products (excel_row, barcode, categoria, sabor) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (excel_row) DO UPDATE SET "
+                    "barcode = excluded.barcode, categoria = excluded.categoria, sabor = excluded.sabor",
+                    (int(excel_row), product_info['barcode'], product_info['categoria'], product_info['sabor'])
+                )
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO shops (name, position) "
+                    "VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM shops))",
+                    (shop,)
+                )
+                promo_preco = product_info.get('promo_preco', None)
+                promo_qt = product_info.get('promo_qt', None)
+                self.conn.execute(
+                    "INSERT INTO prices (excel_row, shop, preco, promo_preco, promo_qt) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (excel_row, shop) DO UPDATE SET "
+                    "preco = excluded.preco, promo_preco = excluded.promo_preco, promo_qt = excluded.promo_qt",
+                    (int(excel_row), shop, float(product_info['preco']),
+                     float(promo_preco) if promo_preco is not None else None,
+                     int(promo_qt) if promo_qt is not None else None)
+                )
+
+    def import_xlsx(self, xlsx_path):
+        """Importa de uma vez um produtos.xlsx no layout original, substituindo o conteúdo atual."""
+        df = ExcelCatalogStore(xlsx_path).load()
+        df.columns = pd.MultiIndex.from_tuples([(str(a).strip(), str(b).strip()) for a, b in df.columns])
+        shops = [shop for shop in dict.fromkeys(df.columns.get_level_values(0)) if shop != 'Todas']
+        excel_rows = (df.index + DATA_START_ROW).tolist()
+
+        def text_column(key):
+            return [None if pd.isna(v) else v for v in df[key]]
+
+        def number_column(key, convert):
+            return [None if pd.isna(v) else convert(v) for v in pd.to_numeric(df[key], errors='coerce')]
+
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM prices")
+            self.conn.execute("DELETE FROM products")
+            self.conn.execute("DELETE FROM shops")
+            self.conn.executemany(
+                "INSERT INTO shops (name, position) VALUES (?, ?)",
+                [(shop, position) for position, shop in enumerate(shops)]
+            )
+            self.conn.executemany(
+                "INSERT INTO products (excel_row, barcode, categoria, sabor) VALUES (?, ?, ?, ?)",
+                zip(excel_rows,
+                    text_column(('Todas', 'Codigo de Barras')),
+                    text_column(('Todas', 'Categoria')),
+                    text_column(('Todas', 'Sabor')))
+            )
+            for shop in shops:
+                rows = zip(excel_rows, [shop] * len(excel_rows),
+                           number_column((shop, 'Preco'), float),
+                           number_column((shop, 'Promo Preco'), float),
+                           number_column((shop, 'Promo Quantidade'), int))
+                self.conn.executemany(
+                    "INSERT INTO prices (excel_row, shop, preco, promo_preco, promo_qt) VALUES (?, ?, ?, ?, ?)",
+                    [row for row in rows if row[2] is not None or row[3] is not None or row[4] is not None]
+                )
+
+    def export_xlsx(self, xlsx_path):
+        """Gera um produtos.xlsx no layout original (cabeçalho em duas linhas)."""
+        shops = self.shops()
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Produtos"
+        headers = [("Todas", column) for column in BASE_COLUMNS] + \
+                  [(shop, column) for shop in shops for column in SHOP_COLUMNS]
+        for col, (header1, header2) in enumerate(headers, start=1):
+            ws.cell(row=1, column=col, value=header1)
+            ws.cell(row=2, column=col, value=header2)
+
+        with self.lock:
+            products = self.conn.execute(
+                "SELECT excel_row, barcode, categoria, sabor FROM products ORDER BY excel_row"
+            ).fetchall()
+            prices = {
+                (row[0], row[1]): row[2:]
+                for row in self.conn.execute("SELECT excel_row, shop, preco, promo_preco, promo_qt FROM prices")
+            }
+
+        for excel_row, barcode, categoria, sabor in products:
+            values = [barcode, categoria, sabor]
+            for shop in shops:
+                values.extend(prices.get((excel_row, shop), (None, None, None)))
+            for col, value in enumerate(values, start=1):
+                ws.cell(row=excel_row, column=col, value=value)
+
+        wb.save(xlsx_path)
+
+    def refresh_cache(self):
+        """Nada a fazer: o próprio SQLite já carrega rápido."""
+        return None
+
+    def invalidate_cache(self):
+        pass
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CatalogWriter:
+    """Persistência write-behind do catálogo.
+
+    As edições já foram aplicadas em memória; aqui elas só são enfileiradas.
+    Uma thread grava o lote acumulado com um único save_products depois de
+    `delay` segundos sem novas edições. Edições repetidas da mesma linha/loja
+    são agrupadas e apenas a mais recente é gravada.
+
+    Com `expect_signature`, cada save confere antes se o arquivo ainda é o
+    que foi carregado/mesclado por último; se mudou fora do programa, as
+    edições esperam a mescla (ProductDatabase.merge_catalog) em vez de
+    gravar por cima da mudança.
+
+    Se o save falha (ex.: planilha aberta no Excel), as novas tentativas
+    esperam cada vez mais (até `max_retry_delay`). `on_error` só é chamado
+    na primeira falha seguida e `on_recover` quando um save volta a dar certo.
+    """
+
+    def __init__(self, store, delay=2.0, on_error=None, on_recover=None, max_retry_delay=60.0):
+        self.store = store
+        self.delay = delay
+        self.on_error = on_error
+        self.on_recover = on_recover
+        self.max_retry_delay = max_retry_delay
+        self.failures = 0     # Saves seguidos que falharam
+        self.retry_at = 0.0   # Próxima tentativa depois de uma falha (monotonic)
+        self.pending = {}
+        self.last_submit = 0.0
+        self.condition = threading.Condition()
+        self.writing = False
+        self.writing_rows = set()
+        self.closed = False
+        self.saved_signature = None  # Assinatura do arquivo logo após o último save nosso
+        self.known_signature = None  # Arquivo como o programa o conhece (None = não confere)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, product_info, shop):
+        with self.condition:
+            self.pending[(product_info.get('indexExcel'), shop)] = (dict(product_info), shop)
+            self.last_submit = time.monotonic()
+            self.condition.notify_all()
+
+    def has_pending(self):
+        with self.condition:
+            return bool(self.pending) or self.writing
+
+    def pending_rows(self):
+        """Linhas do Excel com edições ainda não gravadas (inclusive o lote sendo gravado)."""
+        with self.condition:
+            rows = {excel_row for excel_row, shop in self.pending}
+            rows.update(self.writing_rows)
+            return rows
+
+    def expect_signature(self, signature):
+        """O arquivo nesta assinatura já está refletido na memória; pode gravar por cima dele."""
+        with self.condition:
+            self.known_signature = signature
+            self.retry_at = 0.0
+            self.condition.notify_all()
+
+    def file_changed(self):
+        if self.known_signature is None:
+            return False
+        try:
+            return self.store.signature() != self.known_signature
+        except OSError:
+            return False  # Arquivo ausente: save_products trata
+
+    def remap_rows(self, rows):
+        """Acompanha linhas que mudaram de lugar no arquivo (rows: antiga -> nova; texto = apagada)."""
+        if not rows:
+            return
+        with self.condition:
+            pending = {}
+            for (excel_row, shop), (product_info, entry_shop) in self.pending.items():
+                if isinstance(rows.get(excel_row), str):
+                    print(f"Edição descartada: o produto da linha {excel_row} foi apagado do catálogo.")
+                    continue
+                excel_row = rows.get(excel_row, excel_row)
+                product_info['indexExcel'] = excel_row
+                pending[(excel_row, shop)] = (product_info, entry_shop)
+            self.pending = pending
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                # Espera as edições "assentarem" antes de gravar (exceto ao fechar)
+                remaining = max(self.last_submit + self.delay, self.retry_at) - time.monotonic()
+                if remaining > 0 and not self.closed:
+                    self.condition.wait(remaining)
+                    continue
+                batch = self.pending
+                self.pending = {}
+                self.writing = True
+                self.writing_rows = {excel_row for excel_row, shop in batch}
+
+            if self.file_changed():
+                # Alguém salvou o catálogo depois da última carga: mescla primeiro, grava depois
+                with self.condition:
+                    batch.update(self.pending)
+                    self.pending = batch
+                    self.writing = False
+                    self.writing_rows = set()
+                    self.retry_at = time.monotonic() + self.delay
+                    self.condition.notify_all()
+                if self.closed:
+                    print(f"Catálogo alterado fora do programa; {len(batch)} edição(ões) não gravada(s).")
+                    return
+                continue
+
+            try:
+                self.store.save_products(list(batch.values()))
+                self.saved_signature = self.store.signature()
+                if self.known_signature is not None:
+                    self.known_signature = self.saved_signature
+            except Exception as e:
+                print(f"Falha ao salvar o catálogo: {e}")
+                with self.condition:
+                    # Mantém as edições para a próxima tentativa, sem sobrescrever as mais novas
+                    batch.update(self.pending)
+                    self.pending = batch
+                    self.failures += 1
+                    retry_delay = min(self.delay * 2 ** self.failures, self.max_retry_delay)
+                    self.retry_at = time.monotonic() + retry_delay
+                if self.failures == 1 and self.on_error is not None:
+                    self.on_error(e)
+                if self.closed:
+                    with self.condition:
+                        self.writing = False
+                        self.writing_rows = set()
+                        self.condition.notify_all()
+                    return
+            else:
+                if self.failures:
+                    self.failures = 0
+                    self.retry_at = 0.0
+                    if self.on_recover is not None:
+                        self.on_recover()
+                # Reler a planilha só para o cache custaria mais que o próprio save: fica para a próxima abertura
+                self.store.invalidate_cache()
+            with self.condition:
+                self.writing = False
+                self.writing_rows = set()
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Grava imediatamente o que estiver pendente e espera terminar."""
+        with self.condition:
+            self.last_submit = 0.0
+            self.retry_at = 0.0
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: not self.pending and not self.writing, timeout)
+
+    def close(self, timeout=30):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+
+class CatalogWatcher:
+    """Percebe mudanças no arquivo do catálogo feitas fora do programa (ex.: preço alterado no Excel).
+
+    Uma thread compara a assinatura do arquivo a cada `interval` segundos.
+    Os saves do próprio CatalogWriter são reconhecidos e ignorados. Quando a
+    mudança é externa, `read` (leitura e normalização) roda nesta thread e o
+    resultado vai para `on_change(catalog, signature)`, que deve repassá-lo à
+    thread do Tk; quem mescla avisa o writer da assinatura mesclada.
+    """
+
+    def __init__(self, store, writer, read, on_change, signature=None, interval=2.0):
+        self.store = store
+        self.writer = writer
+        self.read = read
+        self.on_change = on_change
+        self.signature = signature if signature is not None else store.signature()
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Ex.: planilha no meio de um save do Excel; tenta de novo na próxima volta
+                print(f"Falha ao recarregar o catálogo: {e}")
+
+    def check(self):
+        """Uma verificação. Retorna True se um catálogo novo foi entregue."""
+        try:
+            signature = self.store.signature()
+        except FileNotFoundError:
+            return False  # Arquivo sendo substituído; aparece de novo na próxima volta
+        if signature == self.signature:
+            return False
+        if self.writer is not None:
+            if self.writer.writing:
+                return False  # Nosso save em andamento
+            if signature == self.writer.saved_signature:
+                self.signature = signature  # Mudança feita por nós mesmos
+                return False
+        catalog = self.read()
+        self.signature = signature
+        self.on_change(catalog, signature)
+        return True
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        self.thread.join(timeout)
+
+
+if __name__ == "__main__":
+    # python -m src.catalog_store import Files/produtos.xlsx Files/produtos.db
+    # python -m src.catalog_store export Files/produtos.db Files/produtos.xlsx
+    if len(sys.argv) != 4 or sys.argv[1] not in ('import', 'export'):
+        print("Uso: python -m src.catalog_store import|export <origem> <destino>")
+        sys.exit(1)
+
+    command, source, target = sys.argv[1:]
+    if command == 'import':
+        store = SQLiteCatalogStore(target)
+        store.import_xlsx(source)
+    else:
+        store = SQLiteCatalogStore(source)
+        store.export_xlsx(target)
+    store.close()
+    print(f"{command}: {source} -> {target}")
@@ -0,0 +1,105 @@
+import tkinter as tk
+from datetime import datetime
+
+
+class DailyCounters:
+    """Totais do dia mantidos em memória e atualizados a cada venda finalizada."""
+
+    def __init__(self):
+        self.reset(datetime.now().strftime('%Y-%m-%d'))
+
+    def reset(self, day):
+        self.day = day
+        self.tickets = 0
+        self.revenue = 0.0
+        self.revenue_by_method = {}
+        self.tickets_by_method = {}
+        self.items_by_category = {}
+
+    def roll_over(self, when):
+        day = when.strftime('%Y-%m-%d')
+        if day != self.day:
+            self.reset(day)
+
+    def seed(self, sales_journal):
+        """Carrega o que já foi vendido hoje (ex.: depois de reiniciar o caixa). Uma consulta indexada."""
+        by_method, by_category = sales_journal.day_totals(self.day)
+        for method, tickets, revenue in by_method:
+            self.tickets += tickets
+            self.revenue += revenue
+            self.tickets_by_method[method] = self.tickets_by_method.get(method, 0) + tickets
+            self.revenue_by_method[method] = self.revenue_by_method.get(method, 0.0) + revenue
+        for category, quantity in by_category:
+            category = (category or '').strip()
+            self.items_by_category[category] = self.items_by_category.get(category, 0) + (quantity or 0)
+
+    def record_sale(self, sale, final_price, when=None):
+        self.roll_over(when or datetime.now())
+        method = sale.payment_method
+        self.tickets += 1
+        self.revenue += final_price
+        self.tickets_by_method[method] = self.tickets_by_method.get(method, 0) + 1
+        self.revenue_by_method[method] = self.revenue_by_method.get(method, 0.0) + final_price
+        for line in sale.current_sale.values():
+            category = line.categoria.strip()
+            self.items_by_category[category] = self.items_by_category.get(category, 0) + line.quantidade
+
+    def average_ticket(self):
+        return self.revenue / self.tickets if self.tickets else 0.0
+
+
+class DashboardWindow:
+    """Painel "Hoje": só lê os contadores em memória, então abre instantaneamente."""
+
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, counters, scale_factor=1.0):
+        self.counters = counters
+        self.window = tk.Toplevel(parent)
+        self.window.title("Vendas de hoje")
+        self.window.configure(bg="#1a1a2e")
+        self.window.geometry(f"{int(500 * scale_factor)}x{int(600 * scale_factor)}")
+
+        title_font = ("Arial", int(20 * scale_factor), "bold")
+        text_font = ("Arial", int(14 * scale_factor))
+
+        self.summary_label = tk.Label(self.window, bg="#1a1a2e", fg="#ffffff", font=title_font, justify=tk.LEFT)
+        self.summary_label.pack(anchor="w", padx=20, pady=(20, 10))
+
+        self.methods_label = tk.Label(self.window, bg="#1a1a2e", fg="#ffffff", font=text_font, justify=tk.LEFT)
+        self.methods_label.pack(anchor="w", padx=20, pady=10)
+
+        self.categories_label = tk.Label(self.window, bg="#1a1a2e", fg="#ffffff", font=text_font, justify=tk.LEFT)
+        self.categories_label.pack(anchor="w", padx=20, pady=10)
+
+        self.refresh()
+
+    def refresh(self):
+        if not self.window.winfo_exists():
+            return
+        counters = self.counters
+        counters.roll_over(datetime.now())
+
+        self.summary_label.config(text=(
+            f"{counters.day}\n"
+            f"Faturamento: R${counters.revenue:.2f}\n"
+            f"Vendas: {counters.tickets}   Ticket médio: R${counters.average_ticket():.2f}"
+        ))
+
+        methods = "\n".join(
+            f"{method or 'Cartão'}: R${revenue:.2f} ({counters.tickets_by_method.get(method, 0)} vendas)"
+            for method, revenue in sorted(counters.revenue_by_method.items(), key=lambda item: -item[1])
+        )
+        self.methods_label.config(text="Por pagamento:\n" + (methods or "-"))
+
+        categories = "\n".join(
+            f"{category}: {quantity}"
+            for category, quantity in sorted(counters.items_by_category.items(), key=lambda item: -item[1])
+        )
+        self.categories_label.config(text="Itens por categoria:\n" + (categories or "-"))
+
+        self.window.after(self.REFRESH_MS, self.refresh)
+
+    def lift(self):
+        self.window.deiconify()
+        self.window.lift()
@@ -1,112 +1,403 @@
+import threading
 from tkinter import ttk, messagebox
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook, Workbook
+
+import src.catalog_store as catalog_store
+import src.promotions as promotions
+import src.search_index as search_index
+
+# Acima disso, mudanças no catálogo remontam o índice de busca (na thread de busca) em vez de corrigi-lo
+SEARCH_REINDEX_LIMIT = 500
+
+
+def row_keys(df):
+    """Chave estável de cada linha -> rótulo: código de barras (+ ocorrência, se repetido) ou a linha."""
+    if df.empty:
+        return pd.Series([], dtype=object)
+    df = df.sort_index()
+    labels = pd.Series(df.index, index=df.index)
+    barcodes = df[('Todas', 'Codigo de Barras')].astype(str).str.strip()
+    missing = barcodes.isin(['', 'nan', 'None'])
+    occurrence = barcodes.groupby(barcodes).cumcount().astype(str)
+    keys = (barcodes + '#' + occurrence).where(~missing, '@' + labels.astype(str))
+    return pd.Series(df.index, index=keys.to_numpy())
 
 
 class ProductDatabase:
-    def __init__(self, filepath='Files/produtos.xlsx'):
+    def __init__(self, filepath='Files/produtos.xlsx', store=None, on_save_error=None, on_load_error=None,
+                 on_save_recovered=None):
         self.filepath = filepath
+        # Backend de armazenamento: produtos.xlsx (padrão) ou SQLite (.db)
+        self.store = store if store is not None else catalog_store.open_store(filepath)
+        self.barcode_index = {}
+        self.search_indexes = {}  # loja -> SearchIndex da versão atual
+        self.search_lock = threading.Lock()  # O índice é montado/trocado pelo Tk e pela thread de busca
+        self.promotion_rules = {}  # loja -> PromotionRules da carga atual
+        self.version = 0  # Incrementado a cada carga/edição do catálogo
+        self.removed_count = 0  # Numera as chaves "Manual_removido_N" de produtos apagados do arquivo
+        self.df = pd.DataFrame()
+        self.shops = []
+        # on_load_error roda na thread que criou o ProductDatabase (a GUI cria fora do Tk)
+        self.on_load_error = on_load_error
+        self.loaded_signature = None  # Assinatura do arquivo na última carga completa
+        self.watcher = None
+        # on_save_error roda na thread do writer; quem mexe no Tk deve repassar à fila de eventos
+        self.writer = catalog_store.CatalogWriter(self.store, on_error=on_save_error, on_recover=on_save_recovered)
         self.load_products()
 
-    def load_products(self):
-        try:
-            # Tentar carregar o arquivo com MultiIndex no cabeçalho (2 linhas)
-            self.df = pd.read_excel(self.filepath, header=[0, 1], dtype=str)
+    def prepare_shops(self):
+        """Deixa prontos o índice de busca e as regras de promoção de todas as lojas."""
+        for shop in self.shops:
+            self.get_search_index(shop)
+            self.get_promotion_rules(shop)
 
-            # **Validação: Verificar se o DataFrame está vazio**
-            if self.df.empty:
-                raise ValueError("O arquivo está vazio.")
+    def show_error(self, message):
+        if self.on_load_error is not None:
+            self.on_load_error(message)
+        else:
+            messagebox.showerror("Erro", message)
 
-            # **Validação: Garantir que o cabeçalho tem o formato MultiIndex esperado**
-            if not isinstance(self.df.columns, pd.MultiIndex):
-                raise ValueError("O arquivo não possui um cabeçalho MultiIndex com duas linhas.")
+    def read_catalog(self):
+        """Lê e normaliza o catálogo sem mexer no estado atual (pode rodar fora da thread do Tk).
 
-            # Limpar espaços em branco nos cabeçalhos
-            self.df.columns = pd.MultiIndex.from_tuples(
-                [(str(x[0]).strip(), str(x[1]).strip()) for x in self.df.columns]
-            )
+        Retorna (df, lojas).
+        """
+        # Tentar carregar o catálogo com MultiIndex no cabeçalho (2 linhas)
+        df = self.store.load()
 
-            # Identificar as lojas no nível 0 do MultiIndex (exceto 'Todas')
-            self.shops = [shop for shop in self.df.columns.levels[0] if shop != 'Todas']
+        # **Validação: Verificar se o DataFrame está vazio**
+        if df.empty:
+            raise ValueError("O arquivo está vazio.")
 
-            # Converter tipos das colunas
-            self.df[('Todas', 'Codigo de Barras')] = self.df[('Todas', 'Codigo de Barras')].astype(str)
-            self.df[('Metadata', 'Excel Row')] = self.df.index + 3
-            for shop in self.shops:
-                self.df[(shop, 'Preco')] = pd.to_numeric(self.df[(shop, 'Preco')], errors='coerce')
-                self.df[(shop, 'Promo Preco')] = pd.to_numeric(self.df[(shop, 'Promo Preco')], errors='coerce')
-                self.df[(shop, 'Promo Quantidade')] = pd.to_numeric(self.df[(shop, 'Promo Quantidade')],
-                                                                    errors='coerce')
+        # **Validação: Garantir que o cabeçalho tem o formato MultiIndex esperado**
+        if not isinstance(df.columns, pd.MultiIndex):
+            raise ValueError("O arquivo não possui um cabeçalho MultiIndex com duas linhas.")
+
+        # Limpar espaços em branco nos cabeçalhos
+        df.columns = pd.MultiIndex.from_tuples(
+            [(str(x[0]).strip(), str(x[1]).strip()) for x in df.columns]
+        )
+
+        # Identificar as lojas no nível 0 do MultiIndex (exceto 'Todas')
+        shops = [shop for shop in df.columns.levels[0] if shop != 'Todas']
+
+        # Converter tipos das colunas
+        df[('Todas', 'Codigo de Barras')] = df[('Todas', 'Codigo de Barras')].astype(str)
+        df[('Metadata', 'Excel Row')] = df.index + 3
+        for shop in shops:
+            df[(shop, 'Preco')] = pd.to_numeric(df[(shop, 'Preco')], errors='coerce')
+            df[(shop, 'Promo Preco')] = pd.to_numeric(df[(shop, 'Promo Preco')], errors='coerce')
+            df[(shop, 'Promo Quantidade')] = pd.to_numeric(df[(shop, 'Promo Quantidade')], errors='coerce')
+        return df, shops
+
+    def load_products(self):
+        try:
+            # Assinatura antes da leitura: uma mudança durante a carga ainda é percebida pelo watcher
+            self.loaded_signature = self.store.signature()
+            self.df, self.shops = self.read_catalog()
 
         except FileNotFoundError:
-            messagebox.showerror("Erro", f"Arquivo {self.filepath} não encontrado.")
+            self.show_error(f"Arquivo {self.filepath} não encontrado.")
             self.df = pd.DataFrame()
             self.shops = []  # Inicializa como lista vazia para evitar novos erros
         except ValueError as ve:
-            messagebox.showerror("Erro", f"Falha ao carregar produtos: {ve}")
+            self.show_error(f"Falha ao carregar produtos: {ve}")
             self.df = pd.DataFrame()
             self.shops = []
         except Exception as e:
-            messagebox.showerror("Erro", f"Erro inesperado: {e}")
+            self.show_error(f"Erro inesperado: {e}")
             self.df = pd.DataFrame()
             self.shops = []
 
+        self.build_barcode_index()
+        self.promotion_rules = {}
+        self.version += 1
+
+    def build_barcode_index(self):
+        """Monta o índice código de barras -> rótulos de linha do DataFrame."""
+        self.barcode_index = {}
+        if self.df.empty:
+            return
+        barcodes = self.df[('Todas', 'Codigo de Barras')].str.strip()
+        for label, barcode in zip(self.df.index, barcodes):
+            self.barcode_index.setdefault(barcode, []).append(label)
+
+    def index_barcode(self, label, barcode, old_barcode=None):
+        """Atualiza o índice para uma única linha (produto novo ou editado)."""
+        if old_barcode is not None and pd.notna(old_barcode):
+            self.unindex_barcode(label, old_barcode)
+        labels = self.barcode_index.setdefault(str(barcode).strip(), [])
+        if label not in labels:
+            labels.append(label)
+
+    def unindex_barcode(self, label, barcode):
+        labels = self.barcode_index.get(str(barcode).strip())
+        if labels and label in labels:
+            labels.remove(label)
+            if not labels:
+                del self.barcode_index[str(barcode).strip()]
+
+    def get_search_index(self, shop):
+        """Índice de busca da loja; remontado (fora do lock) só se ficou para trás do catálogo.
+
+        Monta o índice inteiro, então não deve ser chamado na thread do Tk com
+        o índice desatualizado (ver search_index_ready).
+        """
+        with self.search_lock:
+            index = self.search_indexes.get(shop)
+            if index is not None and index.version == self.version:
+                return index
+            df, version = self.df, self.version
+        index = search_index.SearchIndex(df, shop, version=version)
+        with self.search_lock:
+            current = self.search_indexes.get(shop)
+            if current is None or current.version is None or current.version < version:
+                self.search_indexes[shop] = index
+        return index
+
+    def search_index_ready(self, shop):
+        """True se a busca da loja responde sem montar o índice (pode rodar na thread do Tk)."""
+        with self.search_lock:
+            index = self.search_indexes.get(shop)
+            return index is not None and index.version == self.version
+
+    def search(self, shop, search_term, limit=None, offset=0):
+        """(rótulos, total, versão do catálogo usada) para o termo; seguro fora da thread do Tk."""
+        index = self.get_search_index(shop)
+        with self.search_lock:
+            labels, total = index.search(search_term, limit=limit, offset=offset)
+            return labels, total, index.version
+
+    def reindex_search_rows(self, labels, previous_version):
+        """Corrige os índices de busca em dia só nas linhas alteradas (após self.version += 1)."""
+        if len(labels) > SEARCH_REINDEX_LIMIT:
+            self.warm_search_indexes()
+            return
+        with self.search_lock:
+            for shop, index in self.search_indexes.items():
+                if index.version != previous_version:
+                    continue  # Já estava atrasado: será remontado inteiro
+                price_column = (shop, 'Preco')
+                for label in labels:
+                    if label in self.df.index:
+                        index.update_row(
+                            label,
+                            self.df.at[label, ('Todas', 'Codigo de Barras')],
+                            self.df.at[label, ('Todas', 'Categoria')],
+                            self.df.at[label, ('Todas', 'Sabor')],
+                            self.df.at[label, price_column] if price_column in self.df.columns else np.nan
+                        )
+                    else:
+                        index.remove_row(label)
+                index.version = self.version
+
+    def warm_search_indexes(self):
+        """Remonta em segundo plano os índices das lojas já buscadas (a thread do Tk não espera)."""
+        shops = list(self.search_indexes)
+
+        def build():
+            for shop in shops:
+                self.get_search_index(shop)
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def get_promotion_rules(self, shop):
+        """Regras de promoção da loja, compiladas na primeira venda após cada carga do catálogo."""
+        rules = self.promotion_rules.get(shop)
+        if rules is None:
+            rules = promotions.compile_rules(self.df, shop)
+            self.promotion_rules[shop] = rules
+        return rules
+
+    def format_search_labels(self, df, shop):
+        """Rótulos "codigo - sabor (categoria) - R$preco" das linhas de `df` (uma página de resultados)."""
+        if df.empty:
+            return np.array([], dtype=object)
+        preco = pd.to_numeric(df[(shop, 'Preco')], errors='coerce').to_numpy(dtype=float)
+        preco_text = pd.Series(np.char.mod('%.2f', preco), index=df.index)
+        return (
+                df[('Todas', 'Codigo de Barras')].astype(str) + " - " +
+                df[('Todas', 'Sabor')].astype(str) + " (" +
+                df[('Todas', 'Categoria')].astype(str) + ") - R$" + preco_text
+        ).str.replace('.', ',', regex=False).to_numpy()
+
+    def has_barcode(self, barcode):
+        return barcode.strip() in self.barcode_index
+
     def add_product(self, product_info, shop):
-        try:
-            wb = load_workbook(self.filepath)
-            ws = wb.active
-        except FileNotFoundError:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Produtos"
-            headers = [
-                ("Todas", "Codigo de Barras"),
-                ("Todas", "Sabor"),
-                ("Todas", "Categoria"),
-                (shop, "Preco"),
-                (shop, "Promo Preco"),
-                (shop, "Promo Quantidade")
-            ]
-            for col, (header1, header2) in enumerate(headers, start=1):
-                ws.cell(row=1, column=col, value=header1)
-                ws.cell(row=2, column=col, value=header2)
-
-        # Map headers to column indices
-        header_map = {
-            f"{ws.cell(row=1, column=col).value} {ws.cell(row=2, column=col).value}": col
-            for col in range(1, ws.max_column + 1)
-        }
+        """Aplica a edição direto no DataFrame e nos índices; a gravação em disco fica com o writer."""
         excel_row = product_info.get('indexExcel', None)
         if excel_row is None:
-            # Encontrar a próxima linha vazia para o código de barras
-            data_start_row = 3
-            barcode_col = header_map.get("Todas Codigo de Barras")
-            excel_row = data_start_row
-            while ws.cell(row=excel_row, column=barcode_col).value:
-                excel_row += 1
-
-        # Adicionar os dados na mesma linha
-        ws.cell(row=excel_row, column=header_map["Todas Codigo de Barras"], value=product_info['barcode'])
-        ws.cell(row=excel_row, column=header_map["Todas Sabor"], value=product_info['sabor'])
-        ws.cell(row=excel_row, column=header_map["Todas Categoria"], value=product_info['categoria'])
-
-        # Adicionar Preço
-        preco = product_info['preco']
-        ws.cell(row=excel_row, column=header_map[f"{shop} Preco"], value=float(preco))
-
-        # Adicionar Promo Preço, se disponível
-        promo_preco = product_info.get('promo_preco', None)
-        ws.cell(row=excel_row, column=header_map[f"{shop} Promo Preco"],
-                value=float(promo_preco) if promo_preco is not None else "")
+            excel_row = (self.df.index.max() + 4) if not self.df.empty else 3
+        excel_row = int(excel_row)
+        label = excel_row - 3
+        product_info = dict(product_info, indexExcel=excel_row)
 
-        # Adicionar Promo Quantidade, se disponível
+        promo_preco = product_info.get('promo_preco', None)
         promo_qt = product_info.get('promo_qt', None)
-        ws.cell(row=excel_row, column=header_map[f"{shop} Promo Quantidade"],
-                value=int(promo_qt) if promo_qt is not None else "")
+        values = {
+            ('Todas', 'Codigo de Barras'): str(product_info['barcode']),
+            ('Todas', 'Sabor'): product_info['sabor'],
+            ('Todas', 'Categoria'): product_info['categoria'],
+            (shop, 'Preco'): float(product_info['preco']),
+            (shop, 'Promo Preco'): float(promo_preco) if promo_preco is not None else np.nan,
+            (shop, 'Promo Quantidade'): float(promo_qt) if promo_qt is not None else np.nan,
+            ('Metadata', 'Excel Row'): excel_row,
+        }
 
-        # Salvar e recarregar produtos
-        wb.save(self.filepath)
-        self.load_products()
+        if not self.df.empty and label in self.df.index:
+            old_barcode = self.df.at[label, ('Todas', 'Codigo de Barras')]
+            for column, value in values.items():
+                self.df.at[label, column] = value
+        else:
+            old_barcode = None
+            if self.df.empty:
+                self.df = pd.DataFrame([values], index=[label])
+                self.df.columns = pd.MultiIndex.from_tuples(self.df.columns)
+                self.shops = [shop]
+            else:
+                new_row = pd.DataFrame([values], index=[label]).reindex(columns=self.df.columns)
+                new_row = new_row.astype(self.df.dtypes.to_dict())
+                self.df = pd.concat([self.df, new_row])
+
+        self.index_barcode(label, values[('Todas', 'Codigo de Barras')], old_barcode)
+        if shop in self.promotion_rules:
+            self.promotion_rules[shop].update_row(excel_row, product_info['preco'], promo_preco, promo_qt)
+        self.version += 1
+        self.reindex_search_rows([label], self.version - 1)
+
+        # Gravação em segundo plano (agrupa várias edições em um único save)
+        self.writer.submit(product_info, shop)
+
+    def watch(self, on_change, interval=2.0):
+        """Passa a vigiar o arquivo do catálogo; on_change recebe ((df, lojas), assinatura) na thread do watcher."""
+        if self.watcher is None:
+            # Daqui em diante o writer só grava sobre o arquivo já carregado/mesclado
+            self.writer.expect_signature(self.loaded_signature)
+            self.watcher = catalog_store.CatalogWatcher(
+                self.store, self.writer, self.read_catalog, on_change,
+                signature=self.loaded_signature, interval=interval
+            )
+        return self.watcher
+
+    def merge_catalog(self, catalog, signature=None):
+        """Aplica no catálogo em memória só as linhas que mudaram no arquivo (thread do Tk).
+
+        As linhas são casadas pelo código de barras, que não muda quando alguém
+        insere ou apaga uma linha no Excel (a linha do Excel só é a chave de
+        quem não tem código). Linhas com edição ainda não gravada pelo writer
+        mantêm o valor em memória. Carrinhos abertos não mudam de preço: cada
+        item já guarda o seu.
+
+        Retorna (alteradas, novas, removidas, linhas), em que `linhas` mapeia
+        linha antiga -> nova do Excel de cada produto que mudou de linha
+        (produtos apagados viram uma chave "Manual_removido_N", como um item
+        digitado à mão), para remapear os itens dos carrinhos abertos e as
+        edições pendentes. `signature` é a do
+        arquivo lido; depois da mescla o writer volta a gravar sobre ele.
+        """
+        new_df, shops = catalog
+        metadata_column = ('Metadata', 'Excel Row')
+        barcode_column = ('Todas', 'Codigo de Barras')
+
+        old_keys = row_keys(self.df)
+        new_keys = row_keys(new_df)
+        common_keys = old_keys.index.intersection(new_keys.index)
+        matched = dict(zip(old_keys[common_keys].tolist(), new_keys[common_keys].tolist()))  # rótulo antigo -> novo
+
+        # Edição pendente pode ter trocado o código só em memória: casa pela própria linha
+        kept = {row - 3 for row in self.writer.pending_rows() if row is not None} & set(self.df.index)
+        unmatched_new = set(new_df.index) - set(matched.values())
+        for label in kept:
+            if label not in matched and label in unmatched_new:
+                matched[label] = label
+                unmatched_new.discard(label)
+
+        removed = self.df.index[~self.df.index.isin(list(matched))]
+        added = new_df.index[new_df.index.isin(list(unmatched_new))]
+        rows = {old + 3: new + 3 for old, new in matched.items() if old != new}
+        for label in removed:
+            self.removed_count += 1
+            rows[label + 3] = f'Manual_removido_{self.removed_count}'
+
+        compare_columns = [column for column in self.df.columns
+                           if column in new_df.columns and column != metadata_column]
+        old_labels = [label for label in matched if label not in kept]
+        old = self.df.loc[old_labels, compare_columns].set_axis([matched[label] for label in old_labels])
+        new = new_df.loc[old.index, compare_columns]
+        different = (old != new) & ~(old.isna() & new.isna())
+        changed = new.index[different.any(axis=1).to_numpy()]
+        if changed.empty and added.empty and removed.empty and not rows:
+            if signature is not None:
+                self.writer.expect_signature(signature)
+            return 0, 0, 0, {}
+
+        self.writer.remap_rows(rows)
+        same_layout = (not self.df.empty and shops == self.shops and set(new_df.columns) == set(self.df.columns))
+        if same_layout and not any(old != new for old, new in matched.items()):
+            # Nenhuma linha mudou de lugar: corrige só as linhas afetadas
+            touched = changed.append(added).append(removed).tolist()
+            old_barcodes = self.df.loc[changed, barcode_column]
+            # Coluna a coluna para não transformar tudo em object
+            for column in compare_columns:
+                self.df.loc[changed, column] = new.loc[changed, column]
+            for label in changed:
+                self.index_barcode(label, self.df.at[label, barcode_column], old_barcodes[label])
+
+            for label in removed:
+                self.unindex_barcode(label, self.df.at[label, barcode_column])
+            self.df = self.df.drop(removed)
+
+            if not added.empty:
+                self.df = pd.concat([self.df, new_df.loc[added, self.df.columns].astype(self.df.dtypes.to_dict())])
+                for label in added:
+                    self.index_barcode(label, self.df.at[label, barcode_column])
+
+            for shop, rules in self.promotion_rules.items():
+                for label in removed:
+                    rules.promo_by_row.pop(label + 3, None)
+                for label in changed.append(added):
+                    preco = self.df.at[label, (shop, 'Preco')]
+                    promo_preco = self.df.at[label, (shop, 'Promo Preco')]
+                    if pd.isna(preco) and pd.isna(promo_preco):
+                        rules.promo_by_row.pop(label + 3, None)  # Sem preço não há promoção
+                    else:
+                        rules.update_row(label + 3, preco, promo_preco,
+                                         self.df.at[label, (shop, 'Promo Quantidade')])
+        else:
+            # Linhas inseridas/apagadas no Excel (ou lojas/colunas novas): o arquivo já lido vira o
+            # catálogo, com as edições pendentes reaplicadas na nova posição de cada produto
+            touched = None
+            df = new_df
+            kept_old = [label for label in kept if label in matched]
+            if kept_old:
+                kept_new = [matched[label] for label in kept_old]
+                for column in compare_columns:
+                    df.loc[kept_new, column] = self.df.loc[kept_old, column].to_numpy()
+            self.df, self.shops = df, shops
+            self.build_barcode_index()
+            # Mesmos objetos de regras (os carrinhos abertos os referenciam), só com as linhas novas
+            for shop, rules in list(self.promotion_rules.items()):
+                if shop in shops:
+                    rules.promo_by_row = promotions.compile_rules(df, shop).promo_by_row
+                else:
+                    del self.promotion_rules[shop]
+
+        self.version += 1
+        if touched is None:
+            self.warm_search_indexes()  # Rótulos mudaram de linha: índice novo, montado fora do Tk
+        else:
+            self.reindex_search_rows(touched, self.version - 1)
+        if signature is not None:
+            self.writer.expect_signature(signature)
+        return len(changed), len(added), len(removed), rows
+
+    def close(self):
+        """Para o watcher e grava edições pendentes antes de sair."""
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.writer.close()
 
     def filter_products(self, search_term, shop):
         if self.df.empty:
@@ -133,7 +424,9 @@ class ProductDatabase:
         """Busca todos os produtos pelo código de barras para a sorveteria atual."""
         try:
             # Filtrar pelo código de barras
-            products = self.df[self.df['Todas', 'Codigo de Barras'].str.strip() == barcode.strip()]
+            products = self.get_products_by_barcode(barcode)
+            if products.empty:
+                return pd.DataFrame()
 
             # Filtrar produtos com preço definido na loja atual
             products = products[pd.notna(products[(shop, 'Preco')])]
@@ -148,4 +441,7 @@ class ProductDatabase:
 
     def get_products_by_barcode(self, barcode):
         """Retorna todos os produtos com o código de barras especificado em qualquer loja."""
-        return self.df[self.df['Todas', 'Codigo de Barras'].str.strip() == barcode.strip()]
+        labels = self.barcode_index.get(barcode.strip())
+        if not labels:
+            return self.df.iloc[0:0]
+        return self.df.loc[labels]
@@ -0,0 +1,192 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Roteiro padrão de uma cobrança na maquininha: (estado, segundos nesse estado)
+DEFAULT_CARD_SCRIPT = [("OPEN", 0.5), ("ON_TERMINAL", 1.0), ("PROCESSING", 0.5)]
+
+
+class FakeMercadoPago:
+    """Servidor local que imita os endpoints do Mercado Pago usados pelo caixa.
+
+    Point (maquininha):  POST/DELETE /point/integration-api/devices/<device>/payment-intents[/<id>]
+                         GET         /point/integration-api/payment-intents/<id>
+    QR (Pix):            PUT         /instore/orders/qr/seller/collectors/<user>/pos/<pos>/qrs
+                         GET/DELETE  /instore/qr/seller/collectors/<user>/pos/<pos>/orders
+
+    Uma cobrança de cartão percorre `card_script` (OPEN -> ON_TERMINAL ->
+    PROCESSING) e termina em `card_outcome` (FINISHED, CANCELED ou
+    ABANDONED). Uma ordem Pix é considerada paga `pix_pay_after` segundos
+    depois de criada (a ordem some e a consulta passa a responder 404).
+    `latency` é somada a toda resposta.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, card_script=None,
+                 card_outcome="FINISHED", pix_pay_after=2.0):
+        self.latency = latency
+        self.card_script = card_script or DEFAULT_CARD_SCRIPT
+        self.card_outcome = card_outcome
+        self.pix_pay_after = pix_pay_after
+        self.lock = threading.Lock()
+        self.intents = {}
+        self.orders = {}
+        self.idempotency = {}
+        self.requests = Counter()
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def card_state(self, intent):
+        if intent["state"] in ("CANCELED", "ABANDONED", "FINISHED"):
+            return intent["state"]
+        elapsed = time.monotonic() - intent["created"]
+        for state, duration in self.card_script:
+            if elapsed < duration:
+                return state
+            elapsed -= duration
+        intent["state"] = self.card_outcome
+        return intent["state"]
+
+    # Rotas ----------------------------------------------------------------
+
+    def create_intent(self, device, body, key):
+        with self.lock:
+            if key and key in self.idempotency:
+                return 201, self.intents[self.idempotency[key]]["public"]
+            intent_id = str(uuid.uuid4())
+            public = {"id": intent_id, "device_id": device, "amount": body.get("amount"),
+                      "additional_info": body.get("additional_info", {})}
+            self.intents[intent_id] = {"created": time.monotonic(), "state": "OPEN", "public": public}
+            if key:
+                self.idempotency[key] = intent_id
+            return 201, public
+
+    def get_intent(self, intent_id):
+        with self.lock:
+            intent = self.intents.get(intent_id)
+            if intent is None:
+                return 404, {"error": "not_found"}
+            return 200, dict(intent["public"], state=self.card_state(intent))
+
+    def cancel_intent(self, intent_id):
+        with self.lock:
+            intent = self.intents.get(intent_id)
+            if intent is None:
+                return 404, {"error": "not_found"}
+            intent["state"] = "CANCELED"
+            return 200, {"id": intent_id}
+
+    def put_order(self, pos, body):
+        with self.lock:
+            order_id = str(uuid.uuid4())
+            self.orders[pos] = {"created": time.monotonic(), "external_reference": body.get("external_reference"),
+                                "total_amount": body.get("total_amount")}
+            return 200, {"in_store_order_id": order_id,
+                         "qr_data": f"00020101021243650016COM.MERCADOLIBRE0201306364{order_id}"}
+
+    def get_order(self, pos):
+        with self.lock:
+            order = self.orders.get(pos)
+            if order is not None and time.monotonic() - order["created"] >= self.pix_pay_after:
+                del self.orders[pos]  # Paga: a ordem sai do caixa
+                order = None
+            if order is None:
+                return 404, {"error": "in_store_order_not_found"}
+            return 200, {"external_reference": order["external_reference"],
+                         "total_amount": order["total_amount"]}
+
+    def delete_order(self, pos):
+        with self.lock:
+            self.orders.pop(pos, None)
+            return 204, None
+
+    def route(self, method, path, body, key):
+        match = re.fullmatch(r"/point/integration-api/devices/([^/]+)/payment-intents", path)
+        if match and method == "POST":
+            return "create_intent", self.create_intent(match.group(1), body, key)
+        match = re.fullmatch(r"/point/integration-api/devices/[^/]+/payment-intents/([^/]+)", path)
+        if match and method == "DELETE":
+            return "cancel_intent", self.cancel_intent(match.group(1))
+        match = re.fullmatch(r"/point/integration-api/payment-intents/([^/]+)", path)
+        if match and method == "GET":
+            return "get_intent", self.get_intent(match.group(1))
+        match = re.fullmatch(r"/instore/orders/qr/seller/collectors/([^/]+)/pos/([^/]+)/qrs", path)
+        if match and method == "PUT":
+            return "put_order", self.put_order(match.groups(), body)
+        match = re.fullmatch(r"/instore/qr/seller/collectors/([^/]+)/pos/([^/]+)/orders", path)
+        if match and method == "GET":
+            return "get_order", self.get_order(match.groups())
+        if match and method == "DELETE":
+            return "delete_order", self.delete_order(match.groups())
+        return "unknown", (404, {"error": "unknown_route"})
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como a API real
+
+            def handle_any(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body = json.loads(raw) if raw else {}
+                if fake.latency:
+                    time.sleep(fake.latency)
+                name, (status, payload) = fake.route(self.command, self.path, body,
+                                                     self.headers.get("X-Idempotency-Key"))
+                with fake.lock:
+                    fake.requests[name] += 1
+
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_any
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # Para usar com o caixa: api_base = "http://127.0.0.1:8765" em src/config.py
+    parser = argparse.ArgumentParser(description="Servidor local que imita o Mercado Pago (Point e QR).")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Segundos somados a cada resposta")
+    parser.add_argument("--resultado", default="FINISHED", choices=["FINISHED", "CANCELED", "ABANDONED"])
+    parser.add_argument("--pix-pago-apos", type=float, default=5.0, help="Segundos até a ordem Pix ser paga")
+    args = parser.parse_args()
+
+    fake = FakeMercadoPago(port=args.port, latency=args.latency, card_outcome=args.resultado,
+                           pix_pay_after=args.pix_pago_apos)
+    print(f"Mercado Pago falso em {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.server.server_close()
@@ -1,22 +1,25 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-from datetime import datetime
 import ctypes
 import platform
 import threading
 import time
-import unicodedata
 
-import src.data_base as db
+import src.catalog_header as catalog_header
 import src.sale as sale
-import src.history as history
-import src.payment as payment
+import src.dashboard as dashboard
+import src.sales_journal as journal
+import src.search_index as search_index
+import src.startup_profile as startup_profile
+import src.ui_events as ui_events
+import src.sale_lines as sale_lines
 
 # Constants for UI scaling
 BASE_WIDTH = 1920
 BASE_HEIGHT = 1080
 Version = "0.4.0"
+SEARCH_PAGE_SIZE = 50  # Máximo de resultados por página no combobox de busca
+CATALOG_PATH = 'Files/produtos.xlsx'
 
 def is_numlock_on():
     if platform.system() != 'Windows':
@@ -55,7 +58,8 @@ class POSApplication:
         self.valor_pago_entry = None
         self.troco_label = None
         self.filtered_products = None
-        self.category_quantities = None
+        self.search_term = ""
+        self.search_total = 0
 
         # Ensure Num Lock is always on
         set_numlock(True)
@@ -66,8 +70,27 @@ class POSApplication:
         self.screen_height = self.root.winfo_screenheight()
         self.scale_factor = min(self.screen_width / BASE_WIDTH, self.screen_height / BASE_HEIGHT)
 
-        # Initialize product database
-        self.product_db = db.ProductDatabase()
+        # Fila de eventos: threads de trabalho só falam com o Tk por aqui
+        self.ui_events = ui_events.UIEventQueue(self.root)
+        self.ui_events.start()
+
+        # Initialize product database: lojas lidas do cabeçalho, catálogo carregado em segundo plano
+        with startup_profile.phase("lojas (cabeçalho)"):
+            self.shops = catalog_header.read_shops(CATALOG_PATH)
+        self.product_db = None     # Preenchido pela thread de carga quando tudo estiver pronto
+        self.catalog_error = None
+        self.catalog_seconds = None
+        threading.Thread(target=self.load_catalog, daemon=True).start()
+
+        # Diário de vendas (append-only)
+        with startup_profile.phase("diário de vendas"):
+            self.sales_journal = journal.SalesJournal()
+
+            # Totais do dia em memória para o painel "Hoje"
+            self.daily_counters = dashboard.DailyCounters()
+            self.daily_counters.seed(self.sales_journal)
+        self.dashboard_window = None
+        self.catalog_error_open = False  # Aviso de falha ao salvar o catálogo já na tela
 
         # Selected shop variable
         self.selected_shop_var = tk.StringVar()
@@ -78,27 +101,67 @@ class POSApplication:
         # Initialize
         self.sale = None
         self.pay = None
-        self.stored_sales = []
+        self.stored_sales = {}          # id -> Sale, carrinhos abertos na ordem de criação
+        self.stored_sale_buttons = {}   # id -> (frame, botão de valor) na barra de carrinhos
+        self.active_sale_id = None      # Carrinho destacado na barra
+        self.empty_sale_ids = {}        # ids dos carrinhos abertos com total zero (dict = ordem de criação)
+        self.edit_rows = {}             # janela de edição aberta -> {'excel_row': linha do produto editado}
 
-        # Dictionary to keep track of widgets for each product
-        self.product_widgets = {}
+        # Linhas do carrinho na tela (widgets reaproveitados entre itens e carrinhos)
+        self.sale_lines = None
 
         # Initialize UI components
         self.select_shop_window()
 
         self.manual_add_count = 0
-        self.manual_add_list = []
 
 
+    def load_catalog(self):
+        """Thread de carga: catálogo, índices de busca e regras de promoção, fora da thread do Tk."""
+        begin = time.perf_counter()
+        try:
+            # pandas, numpy e openpyxl (que puxa o PIL) só são importados aqui
+            import src.data_base as db
+            product_db = db.ProductDatabase(
+                CATALOG_PATH,
+                on_save_error=lambda e: self.ui_events.post(self.show_catalog_save_error, e, key="catalog_save_error"),
+                on_save_recovered=lambda: self.ui_events.post(self.show_catalog_saved, key="catalog_save_error"),
+                on_load_error=lambda message: self.ui_events.post(messagebox.showerror, "Erro", message)
+            )
+            product_db.prepare_shops()
+        except Exception as e:
+            self.catalog_error = e
+            self.ui_events.post(messagebox.showerror, "Erro", f"Erro ao carregar o catálogo: {e}")
+            return
+        self.catalog_seconds = time.perf_counter() - begin
+        self.product_db = product_db  # Só fica visível para o Tk depois de pronto
+
     def select_shop_window(self):
         def on_shop_select():
             selected = shop_combobox.get().strip()
-            if selected:
+            if selected and self.catalog_error is not None:
+                messagebox.showerror("Erro", f"O catálogo não pôde ser carregado: {self.catalog_error}")
+                select_btn.config(state="normal", text="Selecionar")
+            elif selected and self.product_db is None:
+                # Loja escolhida antes do catálogo terminar: espera sem travar a janela
+                select_btn.config(state="disabled", text="Carregando catálogo...")
+                shop_window.after(50, on_shop_select)
+            elif selected:
+                startup_profile.record("catálogo (segundo plano)", self.catalog_seconds)
+                # Preços alterados no Excel com o caixa aberto entram sem reiniciar
+                self.product_db.watch(
+                    lambda catalog, signature: self.ui_events.post(self.apply_catalog_update, catalog, signature,
+                                                                   key="catalog_reload")
+                )
                 self.selected_shop_var.set(selected)
                 shop_window.destroy()
                 self.sale = sale.Sale(self.product_db, selected, self.payment_method_var.get())
-                self.pay = payment.Payment(self, selected)
-                self.build_main_window()
+                with startup_profile.phase("índice de busca"):
+                    self.product_db.get_search_index(selected)  # Monta o índice de busca antes da primeira tecla
+                with startup_profile.phase("janela principal"):
+                    self.build_main_window()
+                    self.root.update_idletasks()
+                startup_profile.report()
             else:
                 messagebox.showerror("Erro", "Selecione a loja para continuar.")
 
@@ -136,7 +199,7 @@ class POSApplication:
         # Combobox
         shop_combobox = ttk.Combobox(
             shop_window,
-            values=self.product_db.shops,  # Usando as lojas definidas no ProductDatabase
+            values=self.shops,  # Lojas lidas do cabeçalho do catálogo
             state="readonly",
             font=combobox_font,
             width=20
@@ -148,6 +211,8 @@ class POSApplication:
         select_btn = ttk.Button(shop_window, text="Selecionar", command=on_shop_select)
         select_btn.pack(pady=int(20 * self.scale_factor))
 
+        shop_window.update_idletasks()
+        startup_profile.mark_first_window()
         self.root.wait_window(shop_window)
 
     def build_main_window(self):
@@ -213,7 +278,13 @@ class POSApplication:
             pady=int(5 * self.scale_factor), sticky=""
         )
         self.barcode_entry.bind('<Return>', self.handle_barcode)
-        self.barcode_entry.bind('<KeyRelease>', self.search_products)
+        self.barcode_entry.bind('<KeyRelease>', self.on_search_key)
+        self.barcode_entry.bind("<<ComboboxSelected>>", self.handle_product_selection)
+
+        # Busca com debounce em segundo plano (só o resultado mais recente volta ao combobox)
+        self.background_search = search_index.BackgroundSearch(
+            self.root, self.ui_events, self.query_products, self.show_search_results
+        )
 
         # Sale Frame
         self.sale_frame = tk.Frame(self.root, bg="#1a1a2e")
@@ -221,6 +292,11 @@ class POSApplication:
             row=2, column=0, padx=int(10 * self.scale_factor),
             pady=int(10 * self.scale_factor), sticky="nw"
         )
+        self.sale_lines = sale_lines.SaleLinePool(
+            self.sale_frame, self.scale_factor,
+            on_quantity=self.update_quantity_dynamic, on_delete=self.delete_product,
+            on_edit=self.edit_product, on_focus=self.select_all_text
+        )
 
         #Stored Sale Frame
         self.stored_sale_frame = tk.Frame(self.root, bg="#1a1a2e")
@@ -355,61 +431,131 @@ class POSApplication:
             pady=int(485 * self.scale_factor), sticky="ne"
         )
 
+        # Dashboard button
+        dashboard_button = tk.Button(
+            self.root, text="Hoje", command=self.open_dashboard,
+            font=button_font, width=23, height=1
+        )
+        dashboard_button.grid(
+            row=2, column=2, padx=int(50 * self.scale_factor),
+            pady=int(540 * self.scale_factor), sticky="ne"
+        )
+
+        self.bind_shortcuts()
         self.update_sale_display()
         self.root.grid_rowconfigure(4, weight=1)
 
+    def bind_shortcuts(self):
+        # Atalhos globais, registrados uma única vez
+        self.root.bind("<Return>", lambda event: (self.barcode_entry.focus(), "break")[1])
+        self.root.bind("<F12>", lambda event: (self.F12_press_handle(), "break")[1])
+        self.root.bind("<End>", lambda event: (self.F12_press_handle(), "break")[1])
+
+        self.root.bind("<F5>", lambda event: (self.update_payment_method(method = "Débito"), "break")[1])
+        self.root.bind("<F6>", lambda event: (self.update_payment_method(method = "Crédito"), "break")[1])
+        self.root.bind("<F7>", lambda event: (self.update_payment_method(method = "Pix"), "break")[1])
+        self.root.bind("<F8>", lambda event: (self.update_payment_method(method = "Dinheiro"), "break")[1])
+        self.root.bind("<F9>", lambda event: (self.cobrar(), "break")[1])
+        self.root.bind("<F10>", lambda event: (self.new_sale(), "break")[1])
+        self.root.bind("<F11>", lambda event: (self.finalize_sale(internal_id=self.sale.id), "break")[1])
+
     def open_sales_history(self):
-        history.SalesHistoryWindow(self.root)
+        import src.history as history  # Só carregado na primeira abertura do histórico
+        history.SalesHistoryWindow(self.root, self.sales_journal)
 
-    def strip_accents(self, text):
-        text = unicodedata.normalize('NFD', text) \
-            .encode('ascii', 'ignore') \
-            .decode("utf-8")
+    def open_dashboard(self):
+        if self.dashboard_window is not None and self.dashboard_window.window.winfo_exists():
+            self.dashboard_window.lift()
+            return
+        self.dashboard_window = dashboard.DashboardWindow(self.root, self.daily_counters, self.scale_factor)
 
-        return str(text)
+    def strip_accents(self, text):
+        return search_index.strip_accents(text)
 
-    def search_products(self, event=None, force_search=False):
+    def on_search_key(self, event=None):
+        # Teclas de navegação não mudam o termo
+        if event is not None and event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
         search_term = self.barcode_entry.get()
+        if search_term and not search_term.isdigit():
+            # A loja é lida aqui, na thread do Tk; a thread de busca só recebe o valor
+            self.background_search.request(search_term, self.selected_shop_var.get())
+        else:
+            self.background_search.cancel()
+
+    def query_products(self, search_term, shop, offset=0):
+        """Executa a busca no índice; seguro para rodar fora da thread do Tk (não lê nada do Tk).
+
+        Retorna (rótulos do DataFrame, total, versão do catálogo usada na busca).
+        """
+        return self.product_db.search(shop, search_term, limit=SEARCH_PAGE_SIZE, offset=offset)
+
+    def show_search_results(self, search_term, result, append=False):
+        import pandas as pd  # Já carregado pela thread do catálogo; fora do caminho da janela de lojas
+        labels, total, version = result
+        if version != self.product_db.version:
+            # Catálogo editado/recarregado entre a consulta e a exibição: os resultados não valem mais
+            if not append:
+                self.background_search.submit(search_term, self.selected_shop_var.get())
+            return
 
-        if not search_term.isdigit() or force_search:
-            if search_term:
-                search_term = self.strip_accents(search_term.lower())
-                shop = self.selected_shop_var.get()
+        page = self.product_db.df.loc[labels]
+        page_labels = self.product_db.format_search_labels(page, self.selected_shop_var.get()).tolist()
+        if append and self.filtered_products is not None:
+            page = pd.concat([self.filtered_products, page])
+            page_labels = list(self.barcode_entry['values'][:len(self.filtered_products)]) + page_labels
 
-                if ',' in search_term:
-                    search_term = search_term.replace(',', '.')
+        self.search_term = search_term
+        self.search_total = total
+        self.filtered_products = page
 
-                # Filter products by barcode, category, flavor, or price
-                self.filtered_products = self.product_db.df[
-                    self.product_db.df[('Todas', 'Codigo de Barras')].str.contains(search_term, case=False, na=False) |
-                    self.product_db.df[('Todas', 'Categoria')].str.contains(search_term, case=False, na=False) |
-                    self.product_db.df[('Todas', 'Sabor')].str.contains(search_term, case=False, na=False) |
-                    self.product_db.df[(shop, 'Preco')].astype(str).str.contains(search_term, case=False, na=False)
-                    ]
+        # Populate the combobox with filtered products (+ entrada para a próxima página)
+        remaining = total - len(page)
+        if remaining > 0:
+            page_labels.append(f"... mais {remaining} resultado(s)")
+        self.barcode_entry['values'] = page_labels
 
-                # Populate the combobox with filtered products
-                self.barcode_entry['values'] = [
-                    f"{product['Todas', 'Codigo de Barras']} - {product['Todas', 'Sabor']} ({product['Todas', 'Categoria']}) - R${product[(shop, 'Preco')]:.2f}".replace(
-                        '.', ',')
-                    for _, product in self.filtered_products.iterrows()
-                ]
+        if self.barcode_entry['values'] and not append:
+            self.barcode_entry.event_generate(
+                "<<ComboboxSelected>>")  # Trigger selection event if results are found
 
-                if self.barcode_entry['values']:
-                    self.barcode_entry.event_generate(
-                        "<<ComboboxSelected>>")  # Trigger selection event if results are found
+    def search_products(self, event=None, force_search=False):
+        search_term = self.barcode_entry.get()
 
-                # Bind selection event to callback
-                self.barcode_entry.bind("<<ComboboxSelected>>", self.handle_product_selection)
+        if not search_term.isdigit() or force_search:
+            if search_term:
+                shop = self.selected_shop_var.get()
+                self.background_search.cancel()
+                if not self.product_db.search_index_ready(shop):
+                    # Índice sendo remontado: a busca vai para a thread de busca em vez de travar o Tk
+                    self.background_search.submit(search_term, shop)
+                    return
+                # Busca síncrona: quem chama precisa do resultado imediatamente
+                self.show_search_results(search_term, self.query_products(search_term, shop))
 
     def handle_product_selection(self, event):
         # Get selected product details
         selected_index = self.barcode_entry.current()
-        if selected_index != -1:  # Ensure a valid selection
-            selected_product = self.filtered_products.iloc[selected_index]
-            self.sale.add_product(selected_product)
-            self.update_sale_display()
-            self.barcode_entry.delete(0, 'end')
-            self.barcode_entry['values'] = []
+        if selected_index == -1 or self.filtered_products is None:
+            return
+
+        if selected_index >= len(self.filtered_products):
+            # Entrada "mais resultados": carrega a próxima página e reabre a lista
+            shop = self.selected_shop_var.get()
+            if not self.product_db.search_index_ready(shop):
+                self.background_search.submit(self.search_term, shop)  # Recomeça a busca fora do Tk
+                return
+            result = self.query_products(self.search_term, shop, offset=len(self.filtered_products))
+            self.show_search_results(self.search_term, result, append=True)
+            self.barcode_entry.set(self.search_term)
+            self.barcode_entry.event_generate('<Down>')
+            return
+
+        selected_product = self.filtered_products.iloc[selected_index]
+        self.sale.add_product(selected_product)
+        self.update_sale_display()
+        self.barcode_entry.delete(0, 'end')
+        self.barcode_entry['values'] = []
 
     def confirm_read_error(self, barcode):
         def compare(event=None):
@@ -470,6 +616,7 @@ class POSApplication:
         #self.root.wait_window(barcode_error_window)
 
     def handle_barcode(self, event=None):
+        import pandas as pd  # Já carregado pela thread do catálogo
 
         input_barcode = self.barcode_entry.get().strip()
         barcode = self.barcode_entry.get().strip()
@@ -490,9 +637,6 @@ class POSApplication:
                     (current_shop, 'Promo Preco'): None,
                     (current_shop, 'Promo Quantidade'): None
                 }
-
-
-                self.manual_add_list.append(product)
                 self.sale.add_product(product)
                 self.update_sale_display(focus_on_=product)
                 self.barcode_entry.delete(0, 'end')
@@ -503,9 +647,17 @@ class POSApplication:
 
         # Se foi digitado uma pesquisa
         if not input_barcode.isdigit():
+            # Enter antes do debounce terminar: busca agora para não abrir a lista desatualizada
+            self.search_products()
             self.barcode_entry.event_generate('<Down>')
             return
 
+        # Código desconhecido: evita montar DataFrames, consulta direto o índice
+        if not self.product_db.has_barcode(barcode):
+            self.confirm_read_error(barcode=barcode)
+            self.barcode_entry.delete(0, 'end')
+            return
+
         # Obtém todos os produtos com o mesmo código de barras na loja atual
         matching_products = self.product_db.get_products_by_barcode_and_shop(barcode, current_shop)
 
@@ -550,184 +702,40 @@ class POSApplication:
     def update_payment_method(self, event=None, method=None):
         if method is not None:
             self.payment_method_var.set(method)
-        self.sale.payment_method = self.payment_method_var.get()
-        self.sale.apply_promotion()
+        self.sale.set_payment_method(self.payment_method_var.get())
         self.update_sale_display()
         if self.payment_method_var.get() == "Dinheiro":
             self.valor_pago_entry.focus()
 
-    def create_or_update_product_widget(self, excel_row, details):
-
-        if excel_row not in self.product_widgets:
-            row = len(self.product_widgets)
-
-            # Nome e categoria
-            text_widget = tk.Text(
-                self.sale_frame, height=1, width=35, bg="#1a1a2e", fg="#ffffff",
-                font=("Arial", 18), bd=0, highlightthickness=0
-            )
-            text_widget.grid(row=row, column=0, padx=50, pady=2, sticky="w")
-            if details['sabor'] == '':
-                text_widget.insert(tk.END, f"{details['categoria']}")
-            else:
-                text_widget.insert(tk.END, f"{details['categoria']} - {details['sabor']}")
-            text_widget.tag_configure("bold", font=("Arial", 18, "bold"))
-            text_widget.config(state=tk.DISABLED)
-
-            # Label de preço
-            price_label = tk.Label(
-                self.sale_frame, text="", bg="#1a1a2e",
-                fg="#ffffff", font=("Arial", 18)
-            )
-            price_label.grid(row=row, column=2, padx=5, pady=2)
-
-            # Entry de quantidade
-            quantity_var = tk.StringVar(value=str(details['quantidade']))
-            quantity_entry = ttk.Entry(
-                self.sale_frame, textvariable=quantity_var, width=5, font=("Arial", 18)
-            )
-            quantity_entry.grid(row=row, column=1, padx=5, pady=2)
-            quantity_entry.bind("<KeyRelease>", lambda event: self.update_quantity_dynamic(excel_row, quantity_var))
-            quantity_entry.bind("<FocusIn>", self.select_all_text)
-
-            # Botão de remover
-            delete_button = tk.Button(
-                self.sale_frame, text="✖",
-                command=lambda b=excel_row: self.delete_product(b),
-                bg="#1a1a2e", fg="#ffffff", font=("Arial", int(16 * self.scale_factor)),
-                borderwidth=0
-            )
-            delete_button.grid(row=row, column=3, padx=5, pady=2)
-
-            self.product_widgets[excel_row] = None
-            if type(excel_row) == str and excel_row.startswith('Manual'):
-                self.product_widgets[excel_row] = {
-                    'text_widget': text_widget,
-                    'price_label': price_label,
-                    'quantity_entry': quantity_entry,
-                    'quantity_var': quantity_var,
-                    'delete_button': delete_button
-                }
-            else:
-                edit_button = tk.Button(
-                    self.sale_frame, text="✎",
-                    command=lambda b=excel_row: self.edit_product(b),
-                    bg="#1a1a2e", fg="#ffffff", font=("Arial", int(16 * self.scale_factor)),
-                    borderwidth=0
-                )
-                edit_button.grid(row=row, column=4, padx=5, pady=2)
-
-                # Armazena os widgets no dicionário
-                self.product_widgets[excel_row] = {
-                    'text_widget': text_widget,
-                    'price_label': price_label,
-                    'quantity_entry': quantity_entry,
-                    'quantity_var': quantity_var,
-                    'delete_button': delete_button,
-                    'edit_button': edit_button
-                }
-
-
+    def line_render_state(self, details):
+        """O que a linha do carrinho mostra: (título, quantidade, preço em centavos, promoção ativa)."""
+        promo = self.sale.is_promo(details)
+        price_cents = details.promo_preco_cents if promo else details.preco_cents
+        if details.sabor == '':
+            title = f"{details.categoria}"
         else:
-            # Atualiza widgets existentes
-            widgets = self.product_widgets[excel_row]
-            widgets['text_widget'].config(state=tk.NORMAL)
-            widgets['text_widget'].delete("1.0", tk.END)
-            if details['sabor'] == '':
-                widgets['text_widget'].insert(tk.END, f"{details['categoria']}")
-            else:
-                widgets['text_widget'].insert(tk.END, f"{details['categoria']} - {details['sabor']}")
-
-            widgets['text_widget'].config(state=tk.DISABLED)
-
-            # Atualiza a quantidade
-            widgets['quantity_var'].set(str(details['quantidade']))
-
-        # Atualiza o preço com base na promoção
-        widgets = self.product_widgets[excel_row]
-
-        #print(self.sale.payment_method in ['Pix', 'Dinheiro'])
-        #print(details['promo_qt'] is not None)
-        #print(self.category_quantities.get(details['categoria'], 0) >= details['promo_qt'])
-
-        if (self.sale.payment_method in ['Pix', 'Dinheiro'] and details['promo_qt'] is not None and
-                self.category_quantities.get(details['categoria'], 0) >= details['promo_qt']):
-            price = details['promo_preco']
-            fg_color = "#00ff00"
-        else:
-            price = details['preco']
-            fg_color = "#ffffff"
-        widgets['price_label'].config(text=f"R${price:.2f}", fg=fg_color)
+            title = f"{details.categoria} - {details.sabor}"
+        return title, details.quantidade, price_cents, promo
 
     def update_sale_display(self, focus_on_=None):
-        # Aplica promoções e calcula o preço final
-        final_price = self.sale.apply_promotion()
-        self.final_price_label.config(text=f"R${final_price:.2f}")
+        # O total já é mantido pelo carrinho a cada alteração
+        self.final_price_label.config(text=f"R${self.sale.final_price:.2f}")
 
         self.payment_method_var.set(self.sale.payment_method)
 
-        # Calcula quantidades por categoria
-        self.category_quantities = {}
-        for details in self.sale.current_sale.values():
-            category = details['categoria']
-            quantity = details['quantidade']
-            self.category_quantities[category] = self.category_quantities.get(category, 0) + quantity
-
-        # Atualiza widgets existentes ou cria novos
-        for excel_row in self.sale.current_sale.keys():
-            #try:
-
-            details = None
-            product_series = None
-
-            #if product is not None and excel_row == product[('Metadata', 'Excel Row')]:
-            #    product_series = product
-            #else:
-            if type(excel_row) != str:
-                product_series = self.product_db.df.loc[excel_row - 3]  # Ajustar para índice do DataFrame
+        # Só as linhas alteradas (ou da categoria reprecificada) tocam nos widgets
+        for excel_row in self.sale.take_changed():
+            details = self.sale.current_sale.get(excel_row)
+            if details is None:
+                self.sale_lines.release(excel_row)
             else:
-                #Quando ha produtos manualmente adicionados
-                for product in self.manual_add_list:
-                    if excel_row == product[('Metadata', 'Excel Row')]:
-                        product_series = product
-
-
-            details = {
-                'categoria': product_series[('Todas', 'Categoria')],
-                'sabor': product_series[('Todas', 'Sabor')],
-                'preco': float(product_series[(self.sale.shop, 'Preco')]),
-                'promo_preco': float(product_series[(self.sale.shop, 'Promo Preco')]) if pd.notna(
-                    product_series[(self.sale.shop, 'Promo Preco')]) else float(
-                    product_series[(self.sale.shop, 'Preco')]),
-                'promo_qt': int(product_series[(self.sale.shop, 'Promo Quantidade')]) if pd.notna(
-                    product_series[(self.sale.shop, 'Promo Quantidade')]) else None,
-                'quantidade': self.sale.current_sale[excel_row]['quantidade'],
-                'indexExcel': excel_row
-            }
-            self.create_or_update_product_widget(excel_row, details)
-            #except Exception as e:
-            #    messagebox.showerror("Erro", f"Erro ao atualizar produto {excel_row}: {e}")
-
-
-
-        # Restaurar o foco no código de barras
-        self.root.bind("<Return>", lambda event: (self.barcode_entry.focus(), "break")[1])
-        self.root.bind("<F12>", lambda event: (self.F12_press_handle(), "break")[1])
-        self.root.bind("<End>", lambda event: (self.F12_press_handle(), "break")[1])
-
-        self.root.bind("<F5>", lambda event: (self.update_payment_method(method = "Débito"), "break")[1])
-        self.root.bind("<F6>", lambda event: (self.update_payment_method(method = "Crédito"), "break")[1])
-        self.root.bind("<F7>", lambda event: (self.update_payment_method(method = "Pix"), "break")[1])
-        self.root.bind("<F8>", lambda event: (self.update_payment_method(method = "Dinheiro"), "break")[1])
-        self.root.bind("<F9>", lambda event: (self.cobrar(), "break")[1])
-        self.root.bind("<F10>", lambda event: (self.new_sale(), "break")[1])
-        self.root.bind("<F11>", lambda event: (self.finalize_sale(internal_id=self.sale.id), "break")[1])
+                self.sale_lines.acquire(excel_row).render(self.line_render_state(details))
 
         # Se um produto foi passado, focar no widget de quantidade correspondente
         if focus_on_ is not None:
             excel_row = focus_on_[('Metadata', 'Excel Row')]
-            if excel_row in self.product_widgets:
-                self.product_widgets[excel_row]['quantity_entry'].focus_set()
+            if excel_row in self.sale_lines:
+                self.sale_lines.get(excel_row).quantity_entry.focus_set()
 
         if self.valor_pago_entry.get():
             self.calcular_troco()
@@ -749,8 +757,7 @@ class POSApplication:
             if new_quantity <= 0:
                 new_quantity = 0
                 self.delete_product(index_excel)
-            if index_excel in self.sale.current_sale:
-                self.sale.current_sale[index_excel]['quantidade'] = max(new_quantity, 0)
+            self.sale.update_quantity(index_excel, new_quantity)
             self.update_sale_display()
         except ValueError:
             if quantity_var.get() != "" :
@@ -758,34 +765,22 @@ class POSApplication:
 
     def delete_product(self, excel_row):
         self.sale.remove_product(excel_row)
-        if excel_row in self.product_widgets:
-            # Destroy all widgets associated with the product
-            for widget in self.product_widgets[excel_row].values():
-                if isinstance(widget, (tk.Widget, ttk.Widget)):
-                    widget.grid_forget()
-                    widget.destroy()
-            # Remove the product from the dictionary
-            del self.product_widgets[excel_row]
-
-        # Reindex and reposition remaining widgets
-        for idx, (key, widgets) in enumerate(self.product_widgets.items()):
-            # Update the grid positions for each widget
-            widgets['text_widget'].grid(row=idx, column=0, padx=50, pady=2, sticky="w")
-            widgets['quantity_entry'].grid(row=idx, column=1, padx=5, pady=2)
-            widgets['price_label'].grid(row=idx, column=2, padx=5, pady=2)
-            widgets['delete_button'].grid(row=idx, column=3, padx=5, pady=2)
-            if 'edit_button' in widgets:  # Only for non-manual entries
-                widgets['edit_button'].grid(row=idx, column=4, padx=5, pady=2)
-
+        # Só esconde a linha; as outras continuam onde estão no grid
+        self.sale_lines.release(excel_row)
         self.update_sale_display()
 
     def edit_product(self, index_excel=None, barcode=None, prefill_store=None):
+        import pandas as pd  # Já carregado pela thread do catálogo
 
         shop = self.sale.shop if prefill_store is None else prefill_store
-        excel_row = None
+        excel_row = None  # Produto novo: a linha é escolhida pelo add_product na hora de salvar
         if index_excel is not None:
             #excel_row = self.sale.current_sale[index_excel]['indexExcel']
             excel_row = index_excel
+            if excel_row - 3 not in self.product_db.df.index:
+                # Linha apagada da planilha depois que o item entrou no carrinho
+                messagebox.showerror("Erro", "Este produto não está mais no catálogo.")
+                return
             product_series = self.product_db.df.loc[excel_row - 3]  # Ajustar para índice do DataFrame
             # Obter os dados atuais do produto
             current_barcode = product_series[('Todas', 'Codigo de Barras')]
@@ -796,7 +791,6 @@ class POSApplication:
             current_promo_qt = product_series[(shop, 'Promo Quantidade')]
 
         else:
-            excel_row = self.product_db.df.index[-1] + 4
             current_barcode = "" if barcode is None else barcode
             current_sabor = ""
             current_categoria = ""
@@ -806,7 +800,15 @@ class POSApplication:
 
 
 
+        # A recarga do catálogo pode mover a linha enquanto a janela está aberta (apply_catalog_update)
+        target = {'excel_row': excel_row}
+
         def save_changes():
+            excel_row = target['excel_row']
+            if type(excel_row) == str:
+                messagebox.showerror("Erro", "Este produto foi apagado do catálogo enquanto era editado.")
+                edit_window.destroy()
+                return
             try:
                 # Obter e limpar os valores dos campos
                 new_barcode = self.strip_accents(barcode_entry.get().strip()).capitalize()
@@ -841,25 +843,9 @@ class POSApplication:
                 self.product_db.add_product(product_info, self.sale.shop)
 
                 # Atualizar os detalhes na venda atual, se o produto estiver na venda
-                if excel_row in self.sale.current_sale:
-                    self.sale.current_sale[excel_row].update({
-                        'categoria': new_categoria,
-                        'sabor': new_sabor,
-                        'preco': new_preco_val,
-                        'promo_preco': new_promo_preco_val if new_promo_preco_val is not None else new_preco_val,
-                        'promo_qt': new_promo_qt_val if new_promo_qt_val is not None else None,
-                    })
-
-                    details = {
-                        'categoria': new_categoria,
-                        'sabor': new_sabor,
-                        'preco': new_preco_val,
-                        'promo_preco': new_promo_preco_val if new_promo_preco_val is not None else new_preco_val,
-                        'promo_qt': new_promo_qt_val if new_promo_qt_val is not None else None,
-                        'quantidade': self.sale.current_sale[excel_row]['quantidade'],
-                        'indexExcel': excel_row
-                    }
-                    self.create_or_update_product_widget(excel_row, details)
+                if excel_row is not None:
+                    self.sale.update_product(excel_row, new_categoria, new_sabor, new_preco_val,
+                                             new_promo_preco_val, new_promo_qt_val)
 
                 self.update_sale_display()  # Atualizar a exibição da venda
                 edit_window.destroy()
@@ -894,6 +880,10 @@ class POSApplication:
         edit_window.title("Editar Produto")
         edit_window.configure(bg="#8b0000")
         edit_window.attributes("-topmost", True)
+        if excel_row is not None:
+            self.edit_rows[edit_window] = target
+            # <Destroy> também chega pelos widgets filhos; só a própria janela está no dicionário
+            edit_window.bind("<Destroy>", lambda event: self.edit_rows.pop(event.widget, None))
 
         # Frame para inputs
         input_frame = tk.Frame(edit_window, bg="#8b0000")
@@ -951,8 +941,7 @@ class POSApplication:
 
     def calcular_troco(self, event=None):
         try:
-            valor_pago = float(self.valor_pago_entry.get().replace(",", "."))
-            troco = valor_pago - self.sale.final_price
+            troco = (sale.to_cents(self.valor_pago_entry.get()) - self.sale.final_cents) / 100
             if troco < 0.0:
                 self.troco_label.config(text=f"Troco: R${troco:.2f}", foreground="#ff5555")
             else:
@@ -961,24 +950,9 @@ class POSApplication:
             self.troco_label.config(text="")
 
     def finalize_sale(self, internal_id):
-        def process_sale():  # Define the threaded process
-            # Load or create sales history
-            try:
-                sales_history = pd.read_excel('Historico_vendas.xlsx')
-            except FileNotFoundError:
-                sales_history = pd.DataFrame(
-                    columns=['Data', 'Horario', 'Preco Final', 'Metodo de pagamento', 'Produtos',
-                             'Quantidade de produtos']
-                )
-
-            # Append new sale
-            updated_sales_history = pd.concat([sales_history, sale_df], ignore_index=True)
-            updated_sales_history.to_excel('Historico_vendas.xlsx', index=False)
-
-            #print(f"Time taken for finalize_sale: {time.time() - start_time:.2f} seconds")
-
-        start_time = time.time()  # Record the start time
-        sale = next((sale for sale in self.stored_sales if sale.id == internal_id), None)
+        sale = self.stored_sales.get(internal_id)
+        if sale is None:
+            return  # Carrinho excluído enquanto a confirmação vinha pela fila
 
         if not sale.current_sale:
             messagebox.showerror("Erro", "Sem produtos nas vendas!")
@@ -987,21 +961,15 @@ class POSApplication:
         # Apply promotion and calculate final price
         final_price = sale.apply_promotion()
 
-        # Save sale details
-        now = datetime.now()
-        sale_data = {
-            'Data': [now.strftime('%Y-%m-%d')],
-            'Horario': [now.strftime('%H:%M:%S')],
-            'Preco Final': [final_price],
-            'Metodo de pagamento': [sale.payment_method],
-            'Produtos': [sale.current_sale],
-            'Quantidade de produtos': [sum(product['quantidade'] for product in sale.current_sale.values())]
-        }
-        sale_df = pd.DataFrame(sale_data)
-        threading.Thread(target=process_sale).start()
-        self.delete_stored_sale(sale.id)
+        # Save sale details (um INSERT no diário, independente do tamanho do histórico)
+        try:
+            self.sales_journal.append_sale(sale, final_price)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao registrar a venda: {e}")
+            return
+        self.daily_counters.record_sale(sale, final_price)
 
-        #print(f"Time taken for creating new sale: {time.time() - start_time :.2f} seconds")
+        self.delete_stored_sale(sale.id)
 
     def new_sale(self, sale_= None):
         # Reset the sale object
@@ -1010,13 +978,9 @@ class POSApplication:
         else:
             self.sale = sale_
 
-        # Clear all widgets from the sale frame
-        for widget in self.sale_frame.winfo_children():
-            widget.grid_forget()
-            widget.destroy()
-
-        # Clear the product widgets dictionary
-        self.product_widgets.clear()
+        # Devolve as linhas do carrinho anterior ao estoque para reuso
+        self.sale_lines.release_all()
+        self.sale.mark_all_changed()
 
         # Reset other UI elements
         self.payment_method_var.set("")
@@ -1029,87 +993,133 @@ class POSApplication:
         self.update_sale_display()
 
     def create_or_update_sale_widgets(self, id):
-        if id not in [sale.id for sale in self.stored_sales]:
-            self.stored_sales.append(self.sale)
+        if id not in self.stored_sales:
+            self.stored_sales[id] = self.sale
 
-            col = len(self.stored_sales)
+            # Um frame por carrinho: ao excluir, o pack reorganiza os demais sozinho
+            cart_frame = tk.Frame(self.stored_sale_frame, bg="#1a1a2e")
+            cart_frame.pack(side=tk.LEFT, padx=(int(18 * self.scale_factor), 0))
 
             text_button = tk.Button(
-                self.stored_sale_frame, text=f"R${self.sale.final_price:.2f}",
+                cart_frame, text=f"R${self.sale.final_price:.2f}",
                 font=("Arial", 18, "bold"), bg="#1a1a2e", fg="#ffffff",
                 anchor="w",
                 bd=0, highlightthickness=0,
                 command=lambda id_=id: self.open_sale(id_)
             )
-            text_button.tag = id
-            text_button.grid(row=0, column=col, padx=int(60 * self.scale_factor), pady=0, sticky="w")
+            text_button.pack(side=tk.LEFT)
 
             # Botão de remover
             delete_button = tk.Button(
-                self.stored_sale_frame, text="✖",
+                cart_frame, text="✖",
                 command=lambda id_=id: self.delete_stored_sale(id_),
                 bg="#1a1a2e", fg="#ffffff", font=("Arial", int(16 * self.scale_factor)),
                 borderwidth=0
             )
-            delete_button.tag = id
-            delete_button.grid(row=0, column=col, padx=int(18 * self.scale_factor), pady=0, stick="e")
+            delete_button.pack(side=tk.LEFT, padx=int(6 * self.scale_factor))
 
+            self.stored_sale_buttons[id] = (cart_frame, text_button)
 
-        for widget in self.stored_sale_frame.winfo_children():
-            if getattr(widget, "tag", None) == id and widget['text'] != "✖":
-                widget['text'] = f"R${self.sale.final_price:.2f}"
-                widget['font'] = ("Arial", 22, "bold")
-            else:
-                widget['font'] = ("Arial", 18)
-
-    def delete_stored_sale(self, id):
-
-        # Find and remove the sale from the stored sales list
-        sale_to_remove = next((sale for sale in self.stored_sales if sale.id == id), None)
-        if sale_to_remove:
-            self.stored_sales.remove(sale_to_remove)
-
-            # Iterate through the widgets in the stored_sale_frame
-            for widget in self.stored_sale_frame.winfo_children():
-                # Compare the tag of the widget (which stores the sale's ID)
-                if hasattr(widget, "tag") and widget.tag == id:
-                    widget.grid_forget()  # Remove the widget from the layout
-                    widget.destroy()  # Destroy the widget
+        # Só o carrinho atual muda de total, então é o único que pode entrar/sair da lista de vazios
+        if self.sale.final_cents == 0:
+            self.empty_sale_ids[id] = None
+        else:
+            self.empty_sale_ids.pop(id, None)
 
+        # Só o carrinho destacado antes e o atual mudam de fonte
+        if self.active_sale_id != id and self.active_sale_id in self.stored_sale_buttons:
+            self.stored_sale_buttons[self.active_sale_id][1]['font'] = ("Arial", 18)
+        self.active_sale_id = id
 
+        text_button = self.stored_sale_buttons[id][1]
+        text_button.configure(text=f"R${self.sale.final_price:.2f}", font=("Arial", 22, "bold"))
 
-        for sale in self.stored_sales:
-            if sale.final_price == 0.00:
-                self.open_sale(sale.id)
-                self.rearrange_sale_widgets()
-                return
+    def delete_stored_sale(self, id):
+        # Encerra a cobrança pendente deste carrinho, se houver
+        if self.pay is not None:
+            self.pay.cancel(id)
+
+        if self.stored_sales.pop(id, None) is not None:
+            self.empty_sale_ids.pop(id, None)
+            cart_frame, _ = self.stored_sale_buttons.pop(id)
+            cart_frame.destroy()
+            if self.active_sale_id == id:
+                self.active_sale_id = None
+
+        # Reaproveita um carrinho vazio, se houver
+        empty_id = next(iter(self.empty_sale_ids), None)
+        if empty_id is not None:
+            self.open_sale(empty_id)
+            return
 
         if self.sale.id == id:
             self.new_sale()
-        self.rearrange_sale_widgets()
-
-    def rearrange_sale_widgets(self):
-        # Reorganize remaining sale buttons if necessary
-        for col, widget in enumerate(self.stored_sale_frame.winfo_children()):
-            if widget["text"] != "✖":
-                widget.grid_configure(column=col)
-            else:
-                widget.grid_configure(column=col-1)
 
     def open_sale(self, id):
-        sale_to_open = next((sale for sale in self.stored_sales if sale.id == id), None)
+        sale_to_open = self.stored_sales.get(id)
         if sale_to_open:
             self.new_sale(sale_to_open)
-            self.update_sale_display()
+
+    def show_catalog_save_error(self, error):
+        # Não abre um segundo aviso por cima do que ainda está na tela
+        if self.catalog_error_open:
+            return
+        self.catalog_error_open = True
+        # Fora do drain da fila: um messagebox aberto ali seguraria os demais eventos (status de pagamento etc.)
+        self.root.after(0, self.show_catalog_save_error_box, error)
+
+    def show_catalog_save_error_box(self, error):
+        try:
+            messagebox.showerror("Erro", f"Falha ao salvar o catálogo: {error}\n"
+                                         "As alterações continuam na tela e serão gravadas na próxima tentativa.")
+        finally:
+            self.catalog_error_open = False
+
+    def show_catalog_saved(self):
+        print("Catálogo salvo novamente.")
+        if self.status_label is not None:
+            self.update_status("Catálogo salvo novamente")
+
+    def apply_catalog_update(self, catalog, signature=None):
+        """Catálogo alterado fora do programa: aplica só as diferenças, sem mexer nos carrinhos abertos."""
+        changed, added, removed, rows = self.product_db.merge_catalog(catalog, signature)
+        if rows:
+            # Linhas inseridas/apagadas no Excel: os itens dos carrinhos seguem o próprio produto
+            sales = dict(self.stored_sales)
+            if self.sale is not None:
+                sales[self.sale.id] = self.sale
+            for open_sale in sales.values():
+                if open_sale.remap_rows(rows) and open_sale is self.sale and self.sale_lines is not None:
+                    self.sale_lines.remap(rows)
+            # Janelas de edição abertas passam a salvar na nova linha do produto
+            for target in self.edit_rows.values():
+                target['excel_row'] = rows.get(target['excel_row'], target['excel_row'])
+        if (rows or added or removed) and self.barcode_entry is not None:
+            # A lista aberta guarda linhas de antes da recarga: escolher uma poderia pôr outro produto no carrinho
+            self.filtered_products = None
+            self.barcode_entry['values'] = []
+        if changed or added or removed:
+            print(f"Catálogo recarregado: {changed} alterados, {added} novos, {removed} removidos")
+            if self.status_label is not None:
+                self.update_status("Catálogo atualizado")
 
     def close_application(self):
+        self.ui_events.stop()
+        if self.product_db is not None:
+            self.product_db.close()
+        self.sales_journal.close()
         self.root.quit()
         self.root.destroy()
 
     def cobrar(self):
-        final_price = self.sale.apply_promotion()
-        if final_price >= 1.00:
-            self.pay.payment(pay_amount=final_price, payment_type=self.sale.payment_method, internal_id=self.sale.id)
+        self.sale.apply_promotion()
+        if self.sale.final_cents >= 100:
+            if self.pay is None:
+                # Pilha de pagamento (requests, cliente do Mercado Pago) só na primeira cobrança
+                import src.payment as payment
+                self.pay = payment.Payment(self, self.selected_shop_var.get())
+            self.pay.payment(amount_cents=self.sale.final_cents, payment_type=self.sale.payment_method,
+                             internal_id=self.sale.id)
 
     def update_status(self, new_status):
         if new_status == "OPEN":
@@ -1122,6 +1132,10 @@ class POSApplication:
             new_status = "Cancelada"
         if new_status == "PROCESSING":
             new_status = "Processando"
+        if new_status == "ABANDONED":
+            new_status = "Abandonada"
+        if new_status == "ERROR":
+            new_status = "Erro"
 
         self.status_label.configure(text=f"{new_status}")
 
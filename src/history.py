@@ -1,13 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import pandas as pd
-import numpy as np
+from datetime import datetime
 import math
 
 
 class ToolTip:
-    def __init__(self, widget):
+    def __init__(self, widget, sales_journal):
         self.widget = widget
+        self.sales_journal = sales_journal
         self.tooltip = None
         self.current_item = None  # Track the currently hovered item
         self.widget.bind("<Motion>", self.on_motion)
@@ -19,15 +19,12 @@ class ToolTip:
         if item != self.current_item:  # Only update if the hovered item changes
             self.current_item = item
             if item:
-                # Get the 'Produtos' value for the hovered item
-                produtos = self.widget.item(item, 'values')[4]
+                # O id do item na Treeview é o sale_id: as linhas vêm tipadas de sale_items
+                produtos = self.sales_journal.items_for_sale(item)
                 if produtos:
                     try:
-                        # Safely evaluate the string into a dictionary
-                        produtos_dict = self.safe_eval_produtos(produtos)
-
                         # Format the products into a readable list
-                        formatted_products = self.format_products(produtos_dict)
+                        formatted_products = self.format_products(produtos)
 
                         # Get the position of the mouse
                         bbox = self.widget.bbox(item)
@@ -62,22 +59,10 @@ class ToolTip:
             self.tooltip = None
             self.current_item = None  # Reset the current item
 
-    def safe_eval_produtos(self, produtos):
-        # Define a safe namespace for evaluation
-        safe_namespace = {
-            "np": np,  # Allow numpy functions
-            "int": int,  # Allow Python int
-            "float": float,  # Allow Python float
-            "nan": np.nan,  # Allow numpy nan
-        }
-
-        # Evaluate the string in the safe namespace
-        return eval(produtos, {"__builtins__": {}}, safe_namespace)
-
-    def format_products(self, produtos_dict):
-        # Format the dictionary into a readable list
+    def format_products(self, produtos):
+        # Format the sale lines into a readable list
         formatted_text = "Produtos:\n"
-        for product_id, details in produtos_dict.items():
+        for details in produtos:
             # Handle None or nan values in the dictionary
             for key, value in details.items():
                 if value is None or (isinstance(value, float) and math.isnan(value)):
@@ -96,12 +81,55 @@ class ToolTip:
             )
         return formatted_text
 class SalesHistoryWindow:
-    def __init__(self, parent):
+    PAGE_SIZE = 200
+
+    # Rótulo do filtro -> valor gravado em metodo_pagamento (None = sem filtro)
+    PAYMENT_FILTERS = {
+        "Todos": None,
+        "Débito": "Débito",
+        "Crédito": "Crédito",
+        "Pix": "Pix",
+        "Dinheiro": "Dinheiro",
+        "Cartão (sem tipo)": "",
+    }
+
+    def __init__(self, parent, sales_journal):
         self.parent = parent
+        self.sales_journal = sales_journal
         self.window = tk.Toplevel(parent)
         self.window.title("Histórico de Vendas")
         self.window.geometry("800x600")
 
+        # Estado da paginação: chave da última linha carregada e se ainda há mais
+        self.last_key = None
+        self.has_more = False
+        self.page_pending = False
+        self.filters = {}
+
+        # Filtros: período e método de pagamento
+        self.filter_frame = tk.Frame(self.window)
+        self.filter_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        tk.Label(self.filter_frame, text="De:").pack(side=tk.LEFT)
+        self.date_from_entry = ttk.Entry(self.filter_frame, width=12)
+        self.date_from_entry.pack(side=tk.LEFT, padx=(0, 10))
+
+        tk.Label(self.filter_frame, text="Até:").pack(side=tk.LEFT)
+        self.date_to_entry = ttk.Entry(self.filter_frame, width=12)
+        self.date_to_entry.pack(side=tk.LEFT, padx=(0, 10))
+
+        tk.Label(self.filter_frame, text="Pagamento:").pack(side=tk.LEFT)
+        self.payment_filter = ttk.Combobox(
+            self.filter_frame, values=list(self.PAYMENT_FILTERS), state="readonly", width=16
+        )
+        self.payment_filter.current(0)
+        self.payment_filter.pack(side=tk.LEFT, padx=(0, 10))
+        self.payment_filter.bind("<<ComboboxSelected>>", lambda event: self.apply_filters())
+
+        ttk.Button(self.filter_frame, text="Filtrar", command=self.apply_filters).pack(side=tk.LEFT)
+        self.date_from_entry.bind("<Return>", lambda event: self.apply_filters())
+        self.date_to_entry.bind("<Return>", lambda event: self.apply_filters())
+
         # Create a frame to hold the Treeview and scrollbars
         self.tree_frame = tk.Frame(self.window)
         self.tree_frame.pack(fill=tk.BOTH, expand=True)
@@ -109,7 +137,7 @@ class SalesHistoryWindow:
         # Create a Treeview widget
         self.tree = ttk.Treeview(
             self.tree_frame,
-            columns=('Data', 'Horario', 'Preco Final', 'Metodo de pagamento', 'Produtos'),
+            columns=('Data', 'Horario', 'Preco Final', 'Metodo de pagamento'),
             show='headings'
         )
         self.tree.heading('Data', text='Data')
@@ -117,51 +145,87 @@ class SalesHistoryWindow:
         self.tree.heading('Preco Final', text='Preço Final')
         self.tree.heading('Metodo de pagamento', text='Método de Pagamento')
 
-        # Hide the 'Produtos' column
-        self.tree['displaycolumns'] = ('Data', 'Horario', 'Preco Final', 'Metodo de pagamento')
-
         # Set column widths
         self.tree.column('Data', width=100, anchor=tk.CENTER)
         self.tree.column('Horario', width=100, anchor=tk.CENTER)
         self.tree.column('Preco Final', width=100, anchor=tk.CENTER)
         self.tree.column('Metodo de pagamento', width=150, anchor=tk.CENTER)
 
-        # Add vertical scrollbar
+        # Add vertical scrollbar (a rolagem perto do fim busca a próxima página)
         self.v_scroll = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=self.v_scroll.set)
+        self.tree.configure(yscrollcommand=self.on_scroll)
         self.v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
         self.tree.pack(fill=tk.BOTH, expand=True)
 
         # Bind hover event to show products
-        self.tooltip = ToolTip(self.tree)
+        self.tooltip = ToolTip(self.tree, sales_journal)
 
         # Load and display sales history
         self.load_sales_history()
 
+    def parse_date(self, text):
+        text = text.strip()
+        if not text:
+            return None
+        for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y'):
+            try:
+                return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+        raise ValueError(f"Data inválida: {text} (use DD/MM/AAAA)")
+
+    def apply_filters(self):
+        try:
+            self.filters = {
+                'date_from': self.parse_date(self.date_from_entry.get()),
+                'date_to': self.parse_date(self.date_to_entry.get()),
+                'payment_method': self.PAYMENT_FILTERS[self.payment_filter.get()],
+            }
+        except ValueError as e:
+            messagebox.showerror("Erro", str(e), parent=self.window)
+            return
+        self.load_sales_history()
+
     def load_sales_history(self):
+        # Recomeça do topo com os filtros atuais
+        self.tree.delete(*self.tree.get_children())
+        self.last_key = None
+        self.has_more = True
+        self.load_next_page()
+
+    def load_next_page(self):
+        self.page_pending = False
+        if not self.has_more:
+            return
         try:
-            sales_history = pd.read_excel('Files/Historico_vendas.xlsx')
-            # Sort by 'Data' and 'Horario' in descending order to show the latest sales first
-            sales_history = sales_history.sort_values(by=['Data', 'Horario'], ascending=[False, False])
-
-            # Replace 'nan' in 'Metodo de pagamento' with an empty string
-            sales_history['Metodo de pagamento'] = sales_history['Metodo de pagamento'].replace({np.nan: ""})
-
-            for _, row in sales_history.iterrows():
-                # Format the 'Preco Final' with R$ and two decimal places
-                preco_final = row['Preco Final']
-                if isinstance(preco_final, (int, float)):
-                    preco_final = f"R${preco_final:.2f}"
-                else:
-                    preco_final = "R$0.00"
-
-                self.tree.insert('', 'end', values=(
-                    row['Data'],
-                    row['Horario'],
-                    preco_final,
-                    row['Metodo de pagamento'],
-                    row['Produtos']
-                ))
-        except FileNotFoundError:
-            messagebox.showerror("Erro", "Arquivo de histórico de vendas não encontrado!")
+            rows = self.sales_journal.query_sales(after=self.last_key, limit=self.PAGE_SIZE, **self.filters)
+        except Exception as e:
+            self.has_more = False
+            messagebox.showerror("Erro", f"Falha ao carregar o histórico de vendas: {e}", parent=self.window)
+            return
+
+        for row_id, sale_id, data, horario, preco_final, metodo in rows:
+            # Format the 'Preco Final' with R$ and two decimal places
+            if isinstance(preco_final, (int, float)):
+                preco_final = f"R${preco_final:.2f}"
+            else:
+                preco_final = "R$0.00"
+
+            self.tree.insert('', 'end', iid=sale_id, values=(
+                data,
+                horario,
+                preco_final,
+                metodo or ""
+            ))
+
+        self.has_more = len(rows) == self.PAGE_SIZE
+        if rows:
+            self.last_key = (rows[-1][2], rows[-1][3], rows[-1][0])
+
+    def on_scroll(self, first, last):
+        self.v_scroll.set(first, last)
+        # Perto do fim da lista: busca a próxima página
+        if self.has_more and not self.page_pending and float(last) > 0.9:
+            self.page_pending = True
+            self.window.after_idle(self.load_next_page)
@@ -0,0 +1,100 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_BASE = "https://api.mercadopago.com"
+
+
+class MercadoPagoClient:
+    """Cliente HTTP do Mercado Pago com sessão keep-alive compartilhada.
+
+    Todas as chamadas reaproveitam o mesmo pool de conexões (sem um handshake
+    TLS por consulta), têm timeout e usam cabeçalhos montados uma única vez.
+    Criações (POST/PUT) mandam um X-Idempotency-Key próprio de cada tentativa
+    de cobrança: as repetições automáticas da mesma requisição (falhas
+    transitórias) são seguras, e uma nova cobrança da mesma venda (cartão
+    recusado, troca de método, total alterado) gera uma cobrança nova.
+
+    As consultas de status (GET de cobrança/ordem) usam uma sessão própria,
+    sem repetições e com timeout curto: quem consulta é a thread única do
+    PaymentMonitor, que não pode ficar presa em uma requisição lenta. Uma
+    consulta que falha vira só mais uma volta do backoff do monitor.
+    """
+
+    def __init__(self, id_token, device, user_id, pos_name, base_url=API_BASE,
+                 timeout=(3.05, 10), retries=3, pool_size=4, poll_timeout=(1.5, 3)):
+        self.timeout = timeout
+        self.poll_timeout = poll_timeout
+        headers = {
+            "Authorization": "Bearer " + id_token,
+            "Content-Type": "application/json",
+        }
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "PUT", "POST", "DELETE"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Consultas do monitor: sem Retry (o monitor tenta de novo no próprio ritmo)
+        self.poll_session = requests.Session()
+        self.poll_session.headers.update(headers)
+        poll_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.poll_session.mount("https://", poll_adapter)
+        self.poll_session.mount("http://", poll_adapter)
+
+        # URLs montadas uma vez
+        base_url = base_url.rstrip("/")
+        self.device_intents_url = f"{base_url}/point/integration-api/devices/{device}/payment-intents"
+        self.intents_url = f"{base_url}/point/integration-api/payment-intents"
+        self.qrs_url = f"{base_url}/instore/orders/qr/seller/collectors/{user_id}/pos/{pos_name}/qrs"
+        self.orders_url = f"{base_url}/instore/qr/seller/collectors/{user_id}/pos/{pos_name}/orders"
+
+    @classmethod
+    def from_config(cls):
+        import src.config as config
+        return cls(config.id_token, config.device, config.user_id, config.pos_name,
+                   base_url=getattr(config, "api_base", API_BASE))
+
+    def request(self, method, url, idempotency_key=None, poll=False, **kwargs):
+        """Faz a chamada e devolve o JSON, ou {"error": ..., "status": ...} em caso de falha."""
+        headers = {"X-Idempotency-Key": idempotency_key} if idempotency_key else None
+        session, timeout = (self.poll_session, self.poll_timeout) if poll else (self.session, self.timeout)
+        try:
+            response = session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+            response.raise_for_status()
+            return response.json() if response.content else {}
+        except requests.exceptions.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            return {"error": str(e), "status": status}
+        except ValueError as e:
+            return {"error": f"Resposta inválida: {e}", "status": None}
+
+    def create_payment_intent(self, payload, idempotency_key):
+        return self.request("POST", self.device_intents_url, idempotency_key=idempotency_key, json=payload)
+
+    def get_payment_intent(self, payment_intent_id):
+        return self.request("GET", f"{self.intents_url}/{payment_intent_id}", poll=True)
+
+    def cancel_payment_intent(self, payment_intent_id):
+        return self.request("DELETE", f"{self.device_intents_url}/{payment_intent_id}")
+
+    def put_qr_order(self, payload, idempotency_key):
+        return self.request("PUT", self.qrs_url, idempotency_key=idempotency_key, json=payload)
+
+    def get_qr_order(self):
+        return self.request("GET", self.orders_url, poll=True)
+
+    def delete_qr_order(self):
+        return self.request("DELETE", self.orders_url)
+
+    def close(self):
+        self.session.close()
+        self.poll_session.close()
@@ -1,48 +1,116 @@
 import tkinter as tk
-import requests
-import qrcode
-from PIL import Image, ImageTk  # Ensure both Image and ImageTk are imported
 import threading
-import time
+import uuid
+
+import src.mercadopago_client as mercadopago_client
+import src.payment_monitor as payment_monitor
+
+CARD_TIMEOUT = 180  # segundos até desistir de uma cobrança na maquininha
+PIX_TIMEOUT = 600   # segundos até desistir de um QR Pix
+QR_BORDER = 4       # módulos de margem branca em volta do QR
+
+
+def new_attempt_key(internal_id):
+    """X-Idempotency-Key de uma tentativa de cobrança da venda."""
+    return f"{internal_id}:{uuid.uuid4()}"
+
+
+def render_qr(qr_data, size):
+    """Gera a imagem do QR já no tamanho final, sem redimensionar depois.
+
+    O tamanho de cada módulo é escolhido para que o código caiba em `size`
+    pixels; a imagem sai com um múltiplo exato do número de módulos, então
+    continua nítida e não passa por reamostragem.
+    """
+    import qrcode  # Só carregado no primeiro Pix
+
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=1,
+        border=QR_BORDER
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+
+    modules = qr.modules_count + 2 * QR_BORDER
+    qr.box_size = max(1, size // modules)
+    return qr.make_image(fill_color="black", back_color="white").get_image()
+
+
+class QRWindow:
+    """Janela modal do QR Pix, montada uma vez e só mostrada/escondida a cada cobrança."""
+
+    def __init__(self, root, scale_factor):
+        self.size = int(900 * scale_factor)
+        self.internal_id = None  # Venda cujo QR está na tela
+
+        win_width = int(1000 * scale_factor)
+        win_height = int(1000 * scale_factor)
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Scan QR Code")
+        self.window.configure(bg="#8b0000")
+        self.window.attributes("-topmost", True)
+        self.window.geometry(f"{win_width}x{win_height}")
+        self.window.resizable(False, False)
+        self.window.protocol("WM_DELETE_WINDOW", self.hide)
+
+        self.label = tk.Label(self.window, bg="#8b0000")
+        self.label.pack(expand=True)
+        self.window.withdraw()
+
+    def show(self, image, internal_id):
+        from PIL import ImageTk  # Só carregado no primeiro Pix
+
+        # PhotoImage precisa ser criado na thread do Tk
+        qr_photo = ImageTk.PhotoImage(image)
+        self.label.configure(image=qr_photo)
+        self.label.image = qr_photo  # Keep a reference to avoid garbage collection
+        self.internal_id = internal_id
+
+        self.window.deiconify()
+        self.window.lift()
+        self.window.grab_set()  # Make the window modal
+
+    def hide(self, internal_id=None):
+        # Um QR antigo (substituído) não fecha o QR da cobrança atual
+        if internal_id is not None and internal_id != self.internal_id:
+            return
+        self.internal_id = None
+        self.window.grab_release()
+        self.window.withdraw()
 
-import src.config as config
 
 class Payment:
-    def __init__(self, app, shop):
+    # Intervalo entre consultas de status (cresce até o máximo enquanto nada muda)
+    poll_interval = 1.0
+    max_poll_interval = 5.0
+
+    def __init__(self, app, shop, client=None):
         self.shop = shop
         self.app = app
-
-    def create_payment_intent_card(self, amount, internal_id):
-
-        url = "https://api.mercadopago.com/point/integration-api/devices/" + config.device + "/payment-intents"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-            "Content-Type": "application/json"
-        }
+        # Sessão HTTP compartilhada (keep-alive, timeouts e retries)
+        self.client = client if client is not None else mercadopago_client.MercadoPagoClient.from_config()
+        # Uma única thread acompanha todas as cobranças pendentes
+        self.monitor = payment_monitor.PaymentMonitor()
+        self.intent_cancellers = {}  # internal_id -> cancela a cobrança no Mercado Pago
+        # Janela do QR criada uma vez (escondida) e reaproveitada a cada Pix
+        self.qr_window = self.create_qr_window()
+
+    def create_payment_intent_card(self, amount_cents, internal_id, idempotency_key=None):
         payload = {
-            "amount": amount * 100,
+            "amount": amount_cents,  # A maquininha recebe o valor em centavos (inteiro)
             "description": "Lolla sorveteria",
             "additional_info": {
                 "external_reference": internal_id,
                 "print_on_terminal": True
             }
         }
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": str(e)}
-
-    def create_payment_intent_debit(self, amount, internal_id):
-
-        url = "https://api.mercadopago.com/point/integration-api/devices/" + config.device + "/payment-intents"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-            "Content-Type": "application/json"
-        }
+        return self.client.create_payment_intent(payload, idempotency_key or new_attempt_key(internal_id))
+
+    def create_payment_intent_debit(self, amount_cents, internal_id, idempotency_key=None):
         payload = {
-            "amount": amount * 100,
+            "amount": amount_cents,  # A maquininha recebe o valor em centavos (inteiro)
             "description": "Lolla sorveteria",
             "payment": {
                 "type": "debit_card"
@@ -52,22 +120,11 @@ class Payment:
                 "print_on_terminal": True
             }
         }
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": str(e)}
-
-    def create_payment_intent_credit(self, amount, internal_id):
-
-        url = "https://api.mercadopago.com/point/integration-api/devices/" + config.device + "/payment-intents"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-            "Content-Type": "application/json"
-        }
+        return self.client.create_payment_intent(payload, idempotency_key or new_attempt_key(internal_id))
+
+    def create_payment_intent_credit(self, amount_cents, internal_id, idempotency_key=None):
         payload = {
-            "amount": amount * 100,
+            "amount": amount_cents,  # A maquininha recebe o valor em centavos (inteiro)
             "description": "Lolla sorveteria",
             "payment": {
                 "installments": 1,
@@ -79,19 +136,10 @@ class Payment:
                 "print_on_terminal": True
             }
         }
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": str(e)}
-
-    def create_payment_intent_pix(self, amount, internal_id):
-        url = "https://api.mercadopago.com/instore/orders/qr/seller/collectors/" + config.user_id + "/pos/" + config.pos_name + "/qrs"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-            "Content-Type": "application/json"
-        }
+        return self.client.create_payment_intent(payload, idempotency_key or new_attempt_key(internal_id))
+
+    def create_payment_intent_pix(self, amount_cents, internal_id, idempotency_key=None):
+        amount = amount_cents / 100  # A ordem QR recebe o valor em reais
         payload = {
             "external_reference": internal_id,
             "title": "Product order",
@@ -107,153 +155,141 @@ class Payment:
                 }
             ]
         }
-        try:
-            response = requests.put(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": str(e)}
+        return self.client.put_qr_order(payload, idempotency_key or new_attempt_key(internal_id))
 
     def confirm_payment_card(self, payment_intent_id):
-
-        url = f"https://api.mercadopago.com/point/integration-api/payment-intents/{payment_intent_id}"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-        }
-
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": str(e)}
+        return self.client.get_payment_intent(payment_intent_id)
 
     def confirm_payment_pix(self):
+        return self.client.get_qr_order()
 
-        url = "https://api.mercadopago.com/instore/qr/seller/collectors/" + config.user_id + "/pos/" + config.pos_name + "/orders"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-            "Content-Type": "application/json"
-        }
-
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": str(e)}
+    def cancel_payment_intent_card(self, payment_intent_id):
+        response = self.client.cancel_payment_intent(payment_intent_id)
+        if "error" in response:
+            print(f"error {response['error']}")
 
     def delete_pix(self):
-
-        url = "https://api.mercadopago.com/instore/qr/seller/collectors/" + config.user_id + "/pos/" + config.pos_name + "/orders"
-        headers = {
-            "Authorization": "Bearer " + config.id_token,
-            "Content-Type": "application/json"
-        }
-
-        try:
-            response = requests.delete(url, headers=headers)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print(f"error {str(e)}")
-
-    def wait_for_payment_to_finish_card(self, payment_intent_id, internal_id, poll_interval=1):
-
-        while True:
-            response = self.confirm_payment_card(payment_intent_id)
-            if "state" in response:
-                state = response["state"]
-                self.app.update_status(state)
-
-                print(f"Payment state: {state}")
-                # if state in ["OPEN", "ON_TERMINAL", "PROCESSING"]:  # Adjust as per terminal state
-                if state == "FINISHED":
-                    payment_id = response.get("id")
-                    print(f"Payment approved with ID: {payment_id}")
-                    self.app.finalize_sale(internal_id)
-                    return payment_id
-
-                if state == "CANCELED" or state == "ABANDONED":
-                    payment_id = response.get("id")
-                    print(state)
-                    print(f"Payment canceled/abandoned with ID: {payment_id}")
-                    return payment_id
-            else:
-                print(f"Error checking payment state: {response.get('error', 'Unknown error')}")
-            time.sleep(poll_interval)
-
-    def wait_for_payment_to_finish_pix(self, internal_id, qr_window, poll_interval=1):
-
-        while True:
-            response = self.confirm_payment_pix()
-            # print("response::")
-            # print(response)
-            if "external_reference" in response:
-                external_reference_ = response["external_reference"]
-                if internal_id != external_reference_:
-                    print(f"{external_reference_} != {internal_id}")
-                    return external_reference_
-                else:
-                    time.sleep(poll_interval)
-            else:
-                print(f"Payment finished with external_reference {internal_id}")
-                qr_window.destroy()  # Close the QR code window
-                self.app.finalize_sale(internal_id)
-                return
+        response = self.client.delete_qr_order()
+        if "error" in response:
+            print(f"error {response['error']}")
+
+    def poll_card(self, payment_intent_id):
+        response = self.confirm_payment_card(payment_intent_id)
+        if "state" not in response:
+            print(f"Error checking payment state: {response.get('error', 'Unknown error')}")
+            return payment_monitor.PENDING, None
+
+        state = response["state"]
+        print(f"Payment state: {state}")
+        if state == "FINISHED":
+            print(f"Payment approved with ID: {response.get('id')}")
+            return payment_monitor.FINISHED, state
+        if state in ("CANCELED", "ABANDONED", "ERROR"):
+            print(f"Payment canceled/abandoned with ID: {response.get('id')}")
+            return payment_monitor.FAILED, state
+        return payment_monitor.PENDING, state
+
+    def poll_pix(self, internal_id):
+        response = self.confirm_payment_pix()
+        if "external_reference" in response:
+            external_reference_ = response["external_reference"]
+            if internal_id != external_reference_:
+                # Outro QR substituiu este no caixa
+                print(f"{external_reference_} != {internal_id}")
+                return payment_monitor.FAILED, "Substituído"
+            return payment_monitor.PENDING, None
+
+        # A ordem some do caixa quando é paga; erros de rede continuam consultando
+        if "error" in response and response.get("status") != 404:
+            print(f"Error checking Pix order: {response['error']}")
+            return payment_monitor.PENDING, None
+        print(f"Payment finished with external_reference {internal_id}")
+        return payment_monitor.FINISHED, "FINISHED"
+
+    def post(self, callback, *args, key=None):
+        # Tudo que toca o Tk passa pela fila de eventos da aplicação
+        self.app.ui_events.post(callback, *args, key=key)
+
+    def set_status(self, status):
+        """Atualiza o status da venda a partir de qualquer thread (rajadas viram uma atualização)."""
+        self.post(self.app.update_status, status, key="payment_status")
+
+    def in_background(self, target, *args):
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    def track_card(self, payment_intent_id, internal_id):
+        def on_failed(status):
+            if status == "TIMEOUT":
+                # Fora da thread do monitor, que continua consultando as outras cobranças
+                self.in_background(self.cancel_payment_intent_card, payment_intent_id)
+                status = "Tempo esgotado"
+            self.set_status(status)
+
+        self.monitor.track(payment_monitor.PaymentIntent(
+            internal_id,
+            poll=lambda: self.poll_card(payment_intent_id),
+            on_finished=lambda: self.post(self.app.finalize_sale, internal_id),
+            on_failed=on_failed,
+            on_status=self.set_status,
+            interval=self.poll_interval,
+            max_interval=self.max_poll_interval,
+            timeout=CARD_TIMEOUT
+        ))
+        self.intent_cancellers[internal_id] = \
+            lambda: self.in_background(self.cancel_payment_intent_card, payment_intent_id)
+
+    def track_pix(self, internal_id):
+        def finish():
+            self.qr_window.hide(internal_id)  # Close the QR code window
+            self.app.finalize_sale(internal_id)
+
+        def on_failed(status):
+            if status == "TIMEOUT":
+                self.in_background(self.delete_pix)
+                status = "Tempo esgotado"
+            self.post(self.qr_window.hide, internal_id)
+            self.set_status(status)
+
+        self.monitor.track(payment_monitor.PaymentIntent(
+            internal_id,
+            poll=lambda: self.poll_pix(internal_id),
+            on_finished=lambda: self.post(finish),
+            on_failed=on_failed,
+            interval=self.poll_interval,
+            max_interval=self.max_poll_interval,
+            timeout=PIX_TIMEOUT
+        ))
+        # Chamado na thread do Tk: esconde o QR agora, a chamada HTTP vai para segundo plano
+        self.intent_cancellers[internal_id] = \
+            lambda: (self.qr_window.hide(internal_id), self.in_background(self.delete_pix))
+
+    def cancel(self, internal_id):
+        """Cancela a cobrança pendente de uma venda (ex.: carrinho excluído ou finalizado à mão)."""
+        intent = self.monitor.cancel(internal_id)
+        canceller = self.intent_cancellers.pop(internal_id, None)
+        if intent is not None and canceller is not None:
+            canceller()
+
+    def create_qr_window(self):
+        return QRWindow(self.app.root, self.app.scale_factor)
 
     def display_qr_code(self, qr_data, internal_id):
-        # Generate the QR code
-        self.app.update_status("Gerando QR")
-
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=int(10 * self.app.scale_factor),  # Adjust box size
-            border=4
-        )
-        qr.add_data(qr_data)
-        qr.make()
-
-        win_width = int(1000 * self.app.scale_factor)
-        win_height = int(1000 * self.app.scale_factor)
-        qr_width = int(900 * self.app.scale_factor)
-        qr_height = int(900 * self.app.scale_factor)
-
-        # Create an image of the QR code
-        img = qr.make_image(fill_color="black", back_color="white")
-        img = img.resize((qr_width, qr_height), Image.Resampling.LANCZOS)  # Updated resizing method
-        qr_photo = ImageTk.PhotoImage(img)
-
-        # Create a new Tkinter window for the QR code
-        qr_window = tk.Toplevel(self.app.root)
-        qr_window.title("Scan QR Code")
-        qr_window.configure(bg="#8b0000")
-        qr_window.attributes("-topmost", True)
-
-        # Set the window size and make it modal
-        qr_window.geometry(f"{win_width}x{win_height}")
-        qr_window.resizable(False, False)
-        qr_window.grab_set()  # Make the window modal
-
-        # Add the QR code image to the window
-        qr_label = tk.Label(qr_window, image=qr_photo, bg="#8b0000")
-        qr_label.image = qr_photo  # Keep a reference to avoid garbage collection
-        qr_label.pack(expand=True)
+        # Roda na thread do Pix: a imagem é gerada aqui e só a exibição vai para o Tk
+        self.set_status("Gerando QR")
+        image = render_qr(qr_data, self.qr_window.size)
+        self.post(self.show_qr, image, internal_id)
 
+    def show_qr(self, image, internal_id):
+        self.qr_window.show(image, internal_id)
         self.app.update_status("Aguardando pagamento")
+        self.track_pix(internal_id)
 
-        # Wait for payment in a separate thread to prevent UI freezing
-        threading.Thread(
-            target=self.wait_for_payment_to_finish_pix,
-            args=(internal_id, qr_window),
-            daemon=True
-        ).start()
-
-    def update_status_thread(self, pay_amount, internal_id):
+    def update_status_thread(self, amount_cents, internal_id, idempotency_key=None):
         # Update the status first before waiting
-        self.app.update_status("Obtendo QR")
+        self.set_status("Obtendo QR")
         self.delete_pix()
-        response = self.create_payment_intent_pix(amount=pay_amount, internal_id=id)
+        response = self.create_payment_intent_pix(amount_cents=amount_cents, internal_id=internal_id,
+                                                  idempotency_key=idempotency_key)
 
         if "in_store_order_id" in response:
             # After waiting, update status again
@@ -261,59 +297,37 @@ class Payment:
             self.display_qr_code(qr, internal_id)
         else:
             print("Failed to create payment intent.")
-            self.app.update_status("Falha")
+            self.set_status("Falha")
 
-    def payment(self, pay_amount, payment_type, internal_id):
-        self.app.update_status("Iniciando pagamento")
+    def start_card_thread(self, create_payment_intent, amount_cents, internal_id, idempotency_key=None):
+        response = create_payment_intent(amount_cents=amount_cents, internal_id=internal_id,
+                                         idempotency_key=idempotency_key)
+        print(response)
 
+        if "id" in response:
+            payment_intent_id = response["id"]
+            self.track_card(payment_intent_id, internal_id)
+        else:
+            print("Failed to create payment intent.")
+            self.set_status("Falha")
 
+    def payment(self, amount_cents, payment_type, internal_id):
+        self.app.update_status("Iniciando pagamento")
+        # Chave nova a cada cobrança; só as repetições automáticas desta requisição a reutilizam
+        idempotency_key = new_attempt_key(internal_id)
+
+        # As chamadas HTTP rodam fora da thread do Tk; o retorno chega pela fila de eventos
         if payment_type == "":
-            response = self.create_payment_intent_card(amount=pay_amount, internal_id=internal_id)
-            print(response)
-
-            if "id" in response:
-                payment_intent_id = response["id"]
-
-                threading.Thread(
-                    target=self.wait_for_payment_to_finish_card,
-                    args=(payment_intent_id, internal_id,),
-                    daemon=True
-                ).start()
-            else:
-                print("Failed to create payment intent.")
-                self.app.update_status("Falha")
-
-        if payment_type == "Débito":
-            response = self.create_payment_intent_debit(amount=pay_amount, internal_id=internal_id)
-            print(response)
-
-            if "id" in response:
-                payment_intent_id = response["id"]
-
-                threading.Thread(
-                    target=self.wait_for_payment_to_finish_card,
-                    args=(payment_intent_id, internal_id,),
-                    daemon=True
-                ).start()
-            else:
-                print("Failed to create payment intent.")
-                self.app.update_status("Falha")
+            self.in_background(self.start_card_thread, self.create_payment_intent_card, amount_cents, internal_id,
+                               idempotency_key)
+
+        elif payment_type == "Débito":
+            self.in_background(self.start_card_thread, self.create_payment_intent_debit, amount_cents, internal_id,
+                               idempotency_key)
 
         elif payment_type == "Crédito":
-            response = self.create_payment_intent_credit(amount=pay_amount, internal_id=internal_id)
-            print(response)
-
-            if "id" in response:
-                payment_intent_id = response["id"]
-                threading.Thread(
-                    target=self.wait_for_payment_to_finish_card,
-                    args=(payment_intent_id, internal_id,),
-                    daemon=True
-                ).start()
-            else:
-                print("Failed to create payment intent.")
-                self.app.update_status("Falha")
+            self.in_background(self.start_card_thread, self.create_payment_intent_credit, amount_cents, internal_id,
+                               idempotency_key)
 
         elif payment_type == "Pix":
-            # Run the sleep and update status in a separate thread
-            threading.Thread(target=self.update_status_thread, args=(pay_amount, id,), daemon=True).start()
\ No newline at end of file
+            self.in_background(self.update_status_thread, amount_cents, internal_id, idempotency_key)
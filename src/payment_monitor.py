@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import threading
+import time
+
+PENDING = "pending"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+class PaymentIntent:
+    """Uma cobrança pendente acompanhada pelo PaymentMonitor.
+
+    `poll` faz uma consulta e retorna (PENDING | FINISHED | FAILED, status).
+    O intervalo entre consultas cresce (backoff) enquanto o status não muda
+    e volta ao mínimo quando muda; passado `timeout`, a cobrança é encerrada.
+    """
+
+    def __init__(self, internal_id, poll, on_finished, on_failed=None, on_status=None,
+                 interval=1.0, max_interval=5.0, backoff=1.5, timeout=180.0):
+        self.internal_id = internal_id
+        self.poll = poll
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self.on_status = on_status
+        self.min_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.deadline = time.monotonic() + timeout
+        self.last_status = None
+        self.cancelled = False
+        self.polls = 0
+
+    def next_interval(self, status):
+        if status != self.last_status:
+            self.last_status = status
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+
+class PaymentMonitor:
+    """Uma única thread que consulta todas as cobranças pendentes.
+
+    As cobranças ficam em um heap ordenado pelo horário da próxima consulta,
+    então o número de threads é sempre um e há no máximo uma requisição de
+    consulta em andamento, não importa quantos carrinhos estejam cobrando.
+    `poll` precisa ser rápido (timeout curto, sem repetições): enquanto ele
+    roda, nenhuma outra cobrança é consultada nem tem o prazo verificado.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.intents = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def track(self, intent):
+        with self.condition:
+            previous = self.intents.get(intent.internal_id)
+            if previous is not None:
+                previous.cancelled = True  # Nova cobrança da mesma venda substitui a anterior
+            self.intents[intent.internal_id] = intent
+            heapq.heappush(self.heap, (time.monotonic(), next(self.counter), intent))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def cancel(self, internal_id):
+        """Para de acompanhar a cobrança. Retorna a cobrança cancelada (ou None)."""
+        with self.condition:
+            intent = self.intents.pop(internal_id, None)
+            if intent is not None:
+                intent.cancelled = True
+                self.condition.notify()
+            return intent
+
+    def pending(self):
+        with self.condition:
+            return list(self.intents)
+
+    def finish(self, intent):
+        with self.condition:
+            if self.intents.get(intent.internal_id) is intent:
+                del self.intents[intent.internal_id]
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    while self.heap and self.heap[0][2].cancelled:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    due = self.heap[0][0] - time.monotonic()
+                    if due <= 0:
+                        break
+                    self.condition.wait(due)
+                _, _, intent = heapq.heappop(self.heap)
+
+            if time.monotonic() > intent.deadline:
+                self.finish(intent)
+                if intent.on_failed is not None:
+                    intent.on_failed("TIMEOUT")
+                continue
+
+            intent.polls += 1
+            try:
+                outcome, status = intent.poll()
+            except Exception as e:
+                outcome, status = PENDING, f"erro: {e}"
+
+            if intent.cancelled:
+                continue
+            if status is not None and status != intent.last_status and intent.on_status is not None:
+                intent.on_status(status)
+
+            if outcome == FINISHED:
+                self.finish(intent)
+                intent.on_finished()
+            elif outcome == FAILED:
+                self.finish(intent)
+                if intent.on_failed is not None:
+                    intent.on_failed(status)
+            else:
+                delay = intent.next_interval(status)
+                with self.condition:
+                    if not intent.cancelled:
+                        heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), intent))
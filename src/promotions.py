@@ -0,0 +1,57 @@
+import pandas as pd
+
+import src.sale as sale
+
+# Exceções por loja aos métodos de pagamento com direito à promoção
+# (lojas ausentes usam sale.PROMO_PAYMENT_METHODS), ex.: {"Vila Nova": ["Pix"]}
+SHOP_PROMO_METHODS = {}
+
+
+class PromotionRules:
+    """Regras de promoção de uma loja, compiladas uma vez por carga do catálogo.
+
+    `promo_by_row` mapeia a linha do Excel para (preço promocional em
+    centavos, quantidade mínima da categoria). A elegibilidade do método de
+    pagamento vira um frozenset, consultado em O(1).
+    """
+
+    def __init__(self, shop, eligible_methods, promo_by_row):
+        self.shop = shop
+        self.eligible_methods = frozenset(eligible_methods)
+        self.promo_by_row = promo_by_row
+
+    def eligible(self, payment_method):
+        return payment_method in self.eligible_methods
+
+    def promo_for(self, excel_row):
+        """(promo_preco_cents, promo_qt) da linha, ou None se ela não tem promoção."""
+        return self.promo_by_row.get(excel_row)
+
+    def update_row(self, excel_row, preco, promo_preco, promo_qt):
+        """Aplica a edição de um produto sem recompilar a loja inteira."""
+        promo_qt = sale.clean_value(promo_qt)
+        if promo_qt is None:
+            self.promo_by_row.pop(excel_row, None)
+            return
+        promo_preco = sale.clean_value(promo_preco)
+        promo_cents = sale.to_cents(promo_preco if promo_preco is not None else preco)
+        self.promo_by_row[excel_row] = (promo_cents, int(promo_qt))
+
+
+def compile_rules(df, shop):
+    """Monta as regras da loja a partir das colunas Promo Preco / Promo Quantidade do catálogo."""
+    promo_by_row = {}
+    if not df.empty and (shop, 'Promo Quantidade') in df.columns:
+        promo_qt = pd.to_numeric(df[(shop, 'Promo Quantidade')], errors='coerce')
+        has_promo = promo_qt.notna()
+        preco = pd.to_numeric(df.loc[has_promo, (shop, 'Preco')], errors='coerce')
+        promo_preco = pd.to_numeric(df.loc[has_promo, (shop, 'Promo Preco')], errors='coerce').fillna(preco)
+        # Centavos calculados de uma vez para a coluna inteira
+        promo_cents = (promo_preco * 100).round()
+        rows = df.loc[has_promo, ('Metadata', 'Excel Row')]
+        for excel_row, cents, threshold in zip(rows, promo_cents, promo_qt[has_promo]):
+            if pd.notna(cents):
+                promo_by_row[int(excel_row)] = (int(cents), int(threshold))
+
+    methods = SHOP_PROMO_METHODS.get(shop, sale.PROMO_PAYMENT_METHODS)
+    return PromotionRules(shop, methods, promo_by_row)
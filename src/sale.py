@@ -1,63 +1,244 @@
+import math
 import uuid
 
+# Métodos de pagamento que dão direito ao preço promocional
+PROMO_PAYMENT_METHODS = ['Pix', 'Dinheiro']
+
+
+def clean_value(value):
+    """None para valores ausentes (None, NaN ou texto vazio)."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def to_cents(value):
+    """Converte um valor em reais (float, int ou texto com ',' ou '.') para centavos inteiros."""
+    if isinstance(value, str):
+        value = value.replace(',', '.')
+    return int(round(float(value) * 100))
+
+
+class LineItem:
+    """Uma linha do carrinho. Preços em centavos inteiros: somas exatas, sem 12.9999999."""
+
+    __slots__ = ('indexExcel', 'categoria', 'sabor', 'preco_cents', 'promo_preco_cents', 'promo_qt', 'quantidade')
+
+    def __init__(self, indexExcel, categoria='', sabor='', preco_cents=0, promo_preco_cents=0,
+                 promo_qt=None, quantidade=1):
+        self.indexExcel = indexExcel
+        self.categoria = categoria
+        self.sabor = sabor
+        self.preco_cents = preco_cents
+        self.promo_preco_cents = promo_preco_cents
+        self.promo_qt = promo_qt
+        self.quantidade = quantidade
+
+    @property
+    def preco(self):
+        return self.preco_cents / 100
+
+    @property
+    def promo_preco(self):
+        return self.promo_preco_cents / 100
+
+    def as_details(self):
+        """A linha no formato de dicionário usado pelo histórico."""
+        return {
+            'categoria': self.categoria,
+            'sabor': self.sabor,
+            'preco': self.preco,
+            'promo_preco': self.promo_preco,
+            'promo_qt': self.promo_qt,
+            'quantidade': self.quantidade,
+            'indexExcel': self.indexExcel
+        }
+
+
 class Sale:
+    """Carrinho com total mantido de forma incremental.
+
+    Quantidades e subtotais (em centavos) são guardados por categoria; cada
+    alteração só reprecifica a categoria afetada, já que a promoção depende
+    apenas da quantidade da própria categoria. As regras (métodos elegíveis,
+    preço e quantidade promocionais) vêm de PromotionRules, compiladas por
+    carga do catálogo.
+    """
+
     def __init__(self, product_db, shop, payment_method=""):
         self.product_db = product_db
         self.shop = shop
+        self.rules = product_db.get_promotion_rules(shop) if product_db is not None else None
+        self.current_sale = {}          # excel_row -> LineItem
+        self.category_lines = {}        # categoria -> {excel_row: LineItem}
+        self.category_quantities = {}   # categoria -> quantidade total no carrinho
+        self.category_subtotals = {}    # categoria -> subtotal em centavos
+        self.changed = {}               # linhas a redesenhar desde o último take_changed() (dict = ordem de inserção)
+        self.final_cents = 0
         self.payment_method = payment_method
-        self.current_sale = {}
-        self.final_price = 0.0
+        self.promo_eligible = self.is_eligible(payment_method)
         self.id = str(uuid.uuid4())
 
-    def apply_promotion(self):
-        total_price = 0.0
-        category_quantities = {}
-
-        # Soma as quantidades por categoria
-        for product in self.current_sale.values():
-            category = product['categoria']
-            quantity = product['quantidade']
-            category_quantities[category] = category_quantities.get(category, 0) + quantity
-
-        # Calcula o preço total com promoções
-        for product in self.current_sale.values():
-            category = product['categoria']
-            quantity = product['quantidade']
-            promo_qty = product['promo_qt']
-            price = product['preco']
-            promo_price = product['promo_preco']
-
-            if (self.payment_method in ['Pix', 'Dinheiro'] and
-                    promo_qty is not None and
-                    category_quantities[category] >= promo_qty):
-                total_price += promo_price * quantity
-            else:
-                total_price += price * quantity
+    @property
+    def final_price(self):
+        return self.final_cents / 100
 
-        self.final_price = total_price
+    def is_eligible(self, payment_method):
+        if self.rules is not None:
+            return self.rules.eligible(payment_method)
+        return payment_method in PROMO_PAYMENT_METHODS
+
+    def is_promo(self, line):
+        return (self.promo_eligible and line.promo_qt is not None and
+                self.category_quantities.get(line.categoria, 0) >= line.promo_qt)
+
+    def unit_cents(self, line):
+        return line.promo_preco_cents if self.is_promo(line) else line.preco_cents
+
+    def apply_promotion(self):
+        """Total com promoções; já está atualizado, então é O(1)."""
         return self.final_price
 
+    def reprice_category(self, category):
+        old_subtotal = self.category_subtotals.pop(category, 0)
+        new_subtotal = 0
+        lines = self.category_lines.get(category)
+        if lines:
+            for line in lines.values():
+                new_subtotal += self.unit_cents(line) * line.quantidade
+            self.category_subtotals[category] = new_subtotal
+            # A promoção pode ter mudado para todas as linhas da categoria
+            self.changed.update(dict.fromkeys(lines))
+        self.final_cents += new_subtotal - old_subtotal
+
+    def register(self, line):
+        self.category_lines.setdefault(line.categoria, {})[line.indexExcel] = line
+        self.category_quantities[line.categoria] = self.category_quantities.get(line.categoria, 0) + line.quantidade
+
+    def unregister(self, line):
+        lines = self.category_lines[line.categoria]
+        del lines[line.indexExcel]
+        if not lines:
+            del self.category_lines[line.categoria]
+        remaining = self.category_quantities[line.categoria] - line.quantidade
+        if remaining > 0:
+            self.category_quantities[line.categoria] = remaining
+        else:
+            del self.category_quantities[line.categoria]
+
+    def set_line(self, line, categoria, sabor, preco, promo_preco=None, promo_qt=None):
+        """Preenche a linha com valores normalizados (sem promoção, o preço promocional é o preço normal)."""
+        preco_cents = to_cents(clean_value(preco) or 0)
+        promo_preco = clean_value(promo_preco)
+        promo_qt = clean_value(promo_qt)
+        line.categoria = clean_value(categoria) or ''
+        line.sabor = clean_value(sabor) or ''
+        line.preco_cents = preco_cents
+        line.promo_preco_cents = to_cents(promo_preco) if promo_preco is not None else preco_cents
+        line.promo_qt = int(promo_qt) if promo_qt is not None else None
+
     def add_product(self, product):
         excel_row = product[('Metadata', 'Excel Row')]
-        if excel_row not in self.current_sale or (type(excel_row) == str and excel_row.startswith('Manual')):
-            self.current_sale[excel_row] = {
-                'categoria': product[('Todas', 'Categoria')],
-                'sabor': product[('Todas', 'Sabor')],
-                'preco': product[(self.shop, 'Preco')],
-                'promo_preco': product.get((self.shop, 'Promo Preco'), product[(self.shop, 'Preco')]),
-                'promo_qt': product.get((self.shop, 'Promo Quantidade'), 1),  # int
-                'quantidade': 1,
-                'indexExcel': excel_row
-            }
+        line = self.current_sale.get(excel_row)
+        if line is None or (type(excel_row) == str and excel_row.startswith('Manual')):
+            if line is not None:
+                self.unregister(line)
+            # Tudo normalizado aqui, uma vez: a tela e o total só leem o carrinho
+            line = LineItem(excel_row)
+            if self.rules is not None and type(excel_row) != str:
+                # Promoção vem da tabela compilada da loja
+                self.set_line(line, product[('Todas', 'Categoria')], product[('Todas', 'Sabor')],
+                              product[(self.shop, 'Preco')])
+                promo = self.rules.promo_for(excel_row)
+                if promo is not None:
+                    line.promo_preco_cents, line.promo_qt = promo
+            else:
+                self.set_line(
+                    line,
+                    categoria=product[('Todas', 'Categoria')],
+                    sabor=product[('Todas', 'Sabor')],
+                    preco=product[(self.shop, 'Preco')],
+                    promo_preco=product.get((self.shop, 'Promo Preco')),
+                    promo_qt=product.get((self.shop, 'Promo Quantidade'))
+                )
+            self.current_sale[excel_row] = line
+            self.register(line)
         else:
-            self.current_sale[excel_row]['quantidade'] += 1
+            line.quantidade += 1
+            self.category_quantities[line.categoria] += 1
+        self.changed[excel_row] = None
+        self.reprice_category(line.categoria)
+
+    def update_product(self, excel_row, categoria, sabor, preco, promo_preco=None, promo_qt=None):
+        """Atualiza os dados de um item do carrinho (ex.: produto editado durante a venda)."""
+        line = self.current_sale.get(excel_row)
+        if line is None:
+            return
+        old_category = line.categoria
+        self.unregister(line)
+        self.set_line(line, categoria, sabor, preco, promo_preco, promo_qt)
+        self.register(line)
+        self.changed[excel_row] = None
+        self.reprice_category(old_category)
+        if line.categoria != old_category:
+            self.reprice_category(line.categoria)
 
     def remove_product(self, excel_row):
-        if excel_row in self.current_sale:
-            del self.current_sale[excel_row]
+        line = self.current_sale.pop(excel_row, None)
+        if line is not None:
+            self.unregister(line)
+            self.changed[excel_row] = None
+            self.reprice_category(line.categoria)
 
     def update_quantity(self, excel_row, quantity):
-        if excel_row in self.current_sale:
-            self.current_sale[excel_row]['quantidade'] = max(quantity, 0)
-            if self.current_sale[excel_row]['quantidade'] == 0:
-                self.remove_product(excel_row)
+        line = self.current_sale.get(excel_row)
+        if line is None:
+            return
+        quantity = max(quantity, 0)
+        if quantity == 0:
+            self.remove_product(excel_row)
+            return
+        self.category_quantities[line.categoria] += quantity - line.quantidade
+        line.quantidade = quantity
+        self.changed[excel_row] = None
+        self.reprice_category(line.categoria)
+
+    def set_payment_method(self, payment_method):
+        self.payment_method = payment_method
+        eligible = self.is_eligible(payment_method)
+        if eligible != self.promo_eligible:
+            # Único caso que afeta todas as categorias
+            self.promo_eligible = eligible
+            for category in list(self.category_lines):
+                self.reprice_category(category)
+
+    def remap_rows(self, rows):
+        """Troca a linha do Excel dos itens que mudaram de lugar no catálogo (rows: antiga -> nova).
+
+        Itens de produtos apagados recebem uma chave "Manual_removido_N" e seguem como item sem cadastro.
+        """
+        if not any(excel_row in rows for excel_row in self.current_sale):
+            return False
+        current_sale = {}
+        for excel_row, line in self.current_sale.items():
+            line.indexExcel = rows.get(excel_row, excel_row)
+            current_sale[line.indexExcel] = line
+        self.current_sale = current_sale
+        self.category_lines = {
+            category: {line.indexExcel: line for line in lines.values()}
+            for category, lines in self.category_lines.items()
+        }
+        self.changed = {rows.get(excel_row, excel_row): None for excel_row in self.changed}
+        return True
+
+    def take_changed(self):
+        """Linhas alteradas desde a última chamada (para a tela redesenhar só elas)."""
+        changed = self.changed
+        self.changed = {}
+        return changed
+
+    def mark_all_changed(self):
+        # Na ordem do carrinho, para as linhas voltarem à tela na mesma ordem
+        self.changed = dict.fromkeys(self.current_sale)
@@ -0,0 +1,137 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class SaleLineRow:
+    """Widgets de uma linha do carrinho (nome, quantidade, preço, remover, editar).
+
+    Criados uma vez e reaproveitados: ao trocar de produto só o conteúdo
+    é reconfigurado. Os callbacks sempre usam a linha atual (`excel_row`).
+    """
+
+    def __init__(self, frame, scale_factor, on_quantity, on_delete, on_edit, on_focus):
+        self.excel_row = None
+        self.rendered = None  # (título, quantidade, preço em centavos, promoção) mostrado agora
+
+        # Nome e categoria
+        self.text_widget = tk.Text(
+            frame, height=1, width=35, bg="#1a1a2e", fg="#ffffff",
+            font=("Arial", 18), bd=0, highlightthickness=0
+        )
+        self.text_widget.tag_configure("bold", font=("Arial", 18, "bold"))
+        self.text_widget.config(state=tk.DISABLED)
+
+        # Entry de quantidade
+        self.quantity_var = tk.StringVar()
+        self.quantity_entry = ttk.Entry(frame, textvariable=self.quantity_var, width=5, font=("Arial", 18))
+        self.quantity_entry.bind("<KeyRelease>", lambda event: on_quantity(self.excel_row, self.quantity_var))
+        self.quantity_entry.bind("<FocusIn>", on_focus)
+
+        # Label de preço
+        self.price_label = tk.Label(frame, text="", bg="#1a1a2e", fg="#ffffff", font=("Arial", 18))
+
+        # Botão de remover
+        self.delete_button = tk.Button(
+            frame, text="✖", command=lambda: on_delete(self.excel_row),
+            bg="#1a1a2e", fg="#ffffff", font=("Arial", int(16 * scale_factor)), borderwidth=0
+        )
+
+        # Botão de editar (não aparece para valores digitados à mão)
+        self.edit_button = tk.Button(
+            frame, text="✎", command=lambda: on_edit(self.excel_row),
+            bg="#1a1a2e", fg="#ffffff", font=("Arial", int(16 * scale_factor)), borderwidth=0
+        )
+
+    def attach(self, excel_row, grid_row):
+        self.excel_row = excel_row
+        self.rendered = None
+        self.text_widget.grid(row=grid_row, column=0, padx=50, pady=2, sticky="w")
+        self.quantity_entry.grid(row=grid_row, column=1, padx=5, pady=2)
+        self.price_label.grid(row=grid_row, column=2, padx=5, pady=2)
+        self.delete_button.grid(row=grid_row, column=3, padx=5, pady=2)
+        if type(excel_row) == str and excel_row.startswith('Manual'):
+            self.edit_button.grid_remove()
+        else:
+            self.edit_button.grid(row=grid_row, column=4, padx=5, pady=2)
+
+    def detach(self):
+        for widget in (self.text_widget, self.quantity_entry, self.price_label, self.delete_button, self.edit_button):
+            widget.grid_remove()
+        self.excel_row = None
+        self.rendered = None
+
+    def render(self, state):
+        if state == self.rendered:
+            return  # Nada mudou nesta linha
+        title, quantity, price_cents, promo = state
+        rendered = self.rendered
+
+        if rendered is None or rendered[0] != title:
+            self.text_widget.config(state=tk.NORMAL)
+            self.text_widget.delete("1.0", tk.END)
+            self.text_widget.insert(tk.END, title)
+            self.text_widget.config(state=tk.DISABLED)
+
+        # Não reescreve o campo enquanto o operador digita o mesmo valor
+        if self.quantity_var.get() != str(quantity):
+            self.quantity_var.set(str(quantity))
+
+        if rendered is None or rendered[2:] != (price_cents, promo):
+            self.price_label.config(text=f"R${price_cents / 100:.2f}", fg="#00ff00" if promo else "#ffffff")
+
+        self.rendered = state
+
+
+class SaleLinePool:
+    """Linhas do carrinho na tela, com as linhas livres guardadas para reuso.
+
+    Cada linha nova ocupa a próxima linha do grid (contador sempre crescente),
+    então remover um item só esconde a linha (grid_remove) sem reposicionar
+    as demais. Trocar de carrinho devolve todas as linhas ao estoque livre.
+    """
+
+    def __init__(self, frame, scale_factor, on_quantity, on_delete, on_edit, on_focus):
+        self.frame = frame
+        self.row_args = (scale_factor, on_quantity, on_delete, on_edit, on_focus)
+        self.rows = {}  # excel_row -> SaleLineRow na tela
+        self.free = []
+        self.next_grid_row = 0
+
+    def __contains__(self, excel_row):
+        return excel_row in self.rows
+
+    def get(self, excel_row):
+        return self.rows.get(excel_row)
+
+    def acquire(self, excel_row):
+        row = self.rows.get(excel_row)
+        if row is not None:
+            return row
+        row = self.free.pop() if self.free else SaleLineRow(self.frame, *self.row_args)
+        row.attach(excel_row, self.next_grid_row)
+        self.next_grid_row += 1
+        self.rows[excel_row] = row
+        return row
+
+    def remap(self, rows):
+        """Acompanha os itens do carrinho que mudaram de linha no catálogo."""
+        remapped = {}
+        for excel_row, row in self.rows.items():
+            row.excel_row = rows.get(excel_row, excel_row)
+            if type(row.excel_row) == str and row.excel_row.startswith('Manual'):
+                row.edit_button.grid_remove()  # Produto apagado do catálogo: vira item sem cadastro
+            remapped[row.excel_row] = row
+        self.rows = remapped
+
+    def release(self, excel_row):
+        row = self.rows.pop(excel_row, None)
+        if row is not None:
+            row.detach()
+            self.free.append(row)
+
+    def release_all(self):
+        for row in self.rows.values():
+            row.detach()
+            self.free.append(row)
+        self.rows.clear()
+        self.next_grid_row = 0
@@ -0,0 +1,314 @@
+import ast
+import math
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+HISTORY_COLUMNS = ['Data', 'Horario', 'Preco Final', 'Metodo de pagamento', 'Produtos', 'Quantidade de produtos']
+ITEM_FIELDS = ['categoria', 'sabor', 'preco', 'promo_preco', 'promo_qt', 'quantidade', 'catalog_row', 'preco_cobrado']
+
+
+class SalesJournal:
+    """Diário de vendas somente-anexação em SQLite (modo WAL).
+
+    Cada venda finalizada é um INSERT de custo constante em `sales` e as
+    linhas do carrinho vão tipadas para `sale_items`, ligadas pelo id da
+    venda. A planilha Historico_vendas.xlsx passa a ser gerada sob demanda
+    por export_xlsx.
+    """
+
+    def __init__(self, filepath='Files/Historico_vendas.db', legacy_xlsx='Files/Historico_vendas.xlsx'):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+        self.migrate_produtos_text()
+        if legacy_xlsx and self.is_empty() and os.path.exists(legacy_xlsx):
+            self.import_xlsx(legacy_xlsx)
+
+    def create_tables(self):
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sales (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sale_id TEXT UNIQUE,
+                    data TEXT NOT NULL,
+                    horario TEXT NOT NULL,
+                    preco_final REAL,
+                    metodo_pagamento TEXT,
+                    quantidade INTEGER,
+                    loja TEXT
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_data ON sales (data, horario)")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_sales_metodo_data ON sales (metodo_pagamento, data, horario)"
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sale_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sale_id TEXT NOT NULL,
+                    categoria TEXT,
+                    sabor TEXT,
+                    preco REAL,
+                    promo_preco REAL,
+                    promo_qt INTEGER,
+                    quantidade INTEGER,
+                    catalog_row INTEGER,
+                    preco_cobrado REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items (sale_id)")
+            # Preço unitário efetivamente cobrado (com a promoção da loja); diários antigos não têm
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sale_items)")]
+            if 'preco_cobrado' not in columns:
+                self.conn.execute("ALTER TABLE sale_items ADD COLUMN preco_cobrado REAL")
+
+    def migrate_produtos_text(self):
+        """Diários antigos guardavam o carrinho como texto na coluna `produtos`: converte para sale_items."""
+        with self.lock:
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sales)")]
+        if 'produtos' not in columns:
+            return
+
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT id, sale_id, produtos FROM sales").fetchall()
+            for row_id, sale_id, produtos in rows:
+                if sale_id is None:
+                    sale_id = str(uuid.uuid4())
+                    self.conn.execute("UPDATE sales SET sale_id = ? WHERE id = ?", (sale_id, row_id))
+                self.insert_items(sale_id, parse_produtos_literal(produtos))
+            try:
+                self.conn.execute("ALTER TABLE sales DROP COLUMN produtos")
+            except sqlite3.OperationalError:
+                # SQLite sem DROP COLUMN: a coluna fica, mas sem uso
+                self.conn.execute("UPDATE sales SET produtos = NULL")
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM sales LIMIT 1").fetchone() is None
+
+    def insert_items(self, sale_id, items):
+        # Chamado com self.lock e a transação já abertos
+        self.conn.executemany(
+            "INSERT INTO sale_items (sale_id, " + ", ".join(ITEM_FIELDS) + ") "
+            "VALUES (?, " + ", ".join("?" for field in ITEM_FIELDS) + ")",
+            [(sale_id,) + tuple(item[field] for field in ITEM_FIELDS) for item in items]
+        )
+
+    def append_sale(self, sale, final_price, when=None):
+        """Registra uma venda finalizada. Custo independe do tamanho do histórico."""
+        when = when or datetime.now()
+        # Guarda o preço unitário cobrado: relatórios não precisam refazer a regra de promoção
+        items = [sale_line_item(key, line.as_details(), sale.unit_cents(line) / 100)
+                 for key, line in sale.current_sale.items()]
+        quantidade = sum(item['quantidade'] for item in items)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO sales (sale_id, data, horario, preco_final, metodo_pagamento, quantidade, loja) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sale.id, when.strftime('%Y-%m-%d'), when.strftime('%H:%M:%S'), float(final_price),
+                 sale.payment_method, quantidade, sale.shop)
+            )
+            self.insert_items(sale.id, items)
+
+    def import_xlsx(self, xlsx_path):
+        """Importa (uma única vez) o histórico antigo da planilha."""
+        import pandas as pd  # Só na migração do histórico antigo
+        legacy = pd.read_excel(xlsx_path)
+        # Planilhas antigas têm as colunas 'Preco final' e 'Preco Final'
+        if 'Preco final' in legacy.columns:
+            if 'Preco Final' in legacy.columns:
+                legacy['Preco Final'] = legacy['Preco Final'].fillna(legacy['Preco final'])
+            else:
+                legacy['Preco Final'] = legacy['Preco final']
+        legacy = legacy.reindex(columns=HISTORY_COLUMNS)
+        legacy = legacy.astype(object).where(pd.notna(legacy), None)
+
+        with self.lock, self.conn:
+            for data, horario, preco_final, metodo, produtos, quantidade in legacy.itertuples(index=False, name=None):
+                sale_id = str(uuid.uuid4())
+                self.conn.execute(
+                    "INSERT INTO sales (sale_id, data, horario, preco_final, metodo_pagamento, quantidade, loja) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (sale_id, _as_text(data, '%Y-%m-%d'), _as_text(horario, '%H:%M:%S'),
+                     float(preco_final) if preco_final is not None else None,
+                     metodo, int(quantidade) if quantidade is not None else None, None)
+                )
+                self.insert_items(sale_id, parse_produtos_literal(produtos))
+
+    def items_for_sale(self, sale_id):
+        """Linhas de uma venda como dicionários (categoria, sabor, preco, ...)."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT " + ", ".join(ITEM_FIELDS) + " FROM sale_items WHERE sale_id = ? ORDER BY id",
+                (sale_id,)
+            ).fetchall()
+        return [dict(zip(ITEM_FIELDS, row)) for row in rows]
+
+    def read_items(self, after_sale_row=None):
+        """Linhas vendidas, já com data, horário, método de pagamento e loja da venda.
+
+        Com `after_sale_row`, só as vendas gravadas depois daquele id (leitura incremental).
+        """
+        import pandas as pd  # Só relatórios/histórico usam DataFrame; o caixa abre sem pandas
+        with self.lock:
+            return pd.read_sql_query(
+                "SELECT s.id AS sale_row, s.sale_id, s.data, s.horario, s.metodo_pagamento, s.loja, "
+                "i.categoria, i.sabor, i.preco, i.promo_preco, i.promo_qt, i.quantidade, i.catalog_row, "
+                "i.preco_cobrado "
+                "FROM sale_items i JOIN sales s ON s.sale_id = i.sale_id WHERE s.id > ? ORDER BY s.id, i.id",
+                self.conn,
+                params=(after_sale_row or 0,)
+            )
+
+    def day_totals(self, day):
+        """Totais de um dia (usa o índice por data): por método de pagamento e itens por categoria."""
+        with self.lock:
+            by_method = self.conn.execute(
+                "SELECT COALESCE(metodo_pagamento, ''), COUNT(*), COALESCE(SUM(preco_final), 0) "
+                "FROM sales WHERE data = ? GROUP BY 1",
+                (day,)
+            ).fetchall()
+            by_category = self.conn.execute(
+                "SELECT i.categoria, SUM(i.quantidade) FROM sales s JOIN sale_items i ON i.sale_id = s.sale_id "
+                "WHERE s.data = ? GROUP BY i.categoria",
+                (day,)
+            ).fetchall()
+        return by_method, by_category
+
+    def last_sale_row(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+
+    def read_sales(self):
+        """Vendas (sem as linhas), uma por registro, com o sale_id."""
+        import pandas as pd
+        with self.lock:
+            return pd.read_sql_query(
+                "SELECT sale_id, data AS 'Data', horario AS 'Horario', preco_final AS 'Preco Final', "
+                "metodo_pagamento AS 'Metodo de pagamento', quantidade AS 'Quantidade de produtos' "
+                "FROM sales ORDER BY id",
+                self.conn
+            )
+
+    def query_sales(self, date_from=None, date_to=None, payment_method=None, after=None, limit=200):
+        """Uma página de vendas, da mais recente para a mais antiga (paginação por chave).
+
+        `after` é a chave (data, horario, id) da última linha da página anterior,
+        então cada página custa o mesmo independente de quantas vendas existem.
+        payment_method '' também casa vendas antigas sem método (NULL).
+        """
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("data >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("data <= ?")
+            params.append(date_to)
+        if payment_method == "":
+            conditions.append("COALESCE(metodo_pagamento, '') = ''")
+        elif payment_method is not None:
+            conditions.append("metodo_pagamento = ?")
+            params.append(payment_method)
+        if after is not None:
+            conditions.append("(data, horario, id) < (?, ?, ?)")
+            params.extend(after)
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, sale_id, data, horario, preco_final, metodo_pagamento FROM sales " + where +
+                " ORDER BY data DESC, horario DESC, id DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+
+    def read_dataframe(self):
+        """Retorna o histórico no mesmo layout da antiga planilha (Produtos remontado a partir de sale_items)."""
+        sales = self.read_sales()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT sale_id, " + ", ".join(ITEM_FIELDS) + " FROM sale_items ORDER BY id"
+            ).fetchall()
+
+        produtos = {}
+        for sale_id, *values in rows:
+            item = dict(zip(ITEM_FIELDS, values))
+            key = item.pop('catalog_row')
+            item.pop('preco_cobrado')  # Mantém o layout antigo da coluna Produtos
+            sale_products = produtos.setdefault(sale_id, {})
+            sale_products[key if key is not None else f"Manual_{len(sale_products) + 1}"] = item
+
+        sales['Produtos'] = [str(produtos.get(sale_id, {})) for sale_id in sales['sale_id']]
+        return sales[HISTORY_COLUMNS]
+
+    def export_xlsx(self, xlsx_path='Files/Historico_vendas.xlsx'):
+        """Gera a planilha Data/Horario/Preco Final/... a partir do diário."""
+        self.read_dataframe().to_excel(xlsx_path, index=False)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _as_text(value, fmt):
+    # Células de data/hora podem vir como datetime/time dependendo de quem salvou a planilha
+    if hasattr(value, 'strftime'):
+        return value.strftime(fmt)
+    return str(value)
+
+
+def _number(value, cast):
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value):
+        return None
+    return cast(value)
+
+
+def sale_line_item(key, details, preco_cobrado=None):
+    """Converte uma linha do carrinho (Sale.current_sale) em um registro tipado de sale_items."""
+    return {
+        'categoria': details.get('categoria'),
+        'sabor': details.get('sabor'),
+        'preco': _number(details.get('preco'), float),
+        'promo_preco': _number(details.get('promo_preco'), float),
+        'promo_qt': _number(details.get('promo_qt'), int),
+        'quantidade': _number(details.get('quantidade'), int) or 0,
+        # Produtos manuais ("Manual_N") não têm linha no catálogo
+        'catalog_row': _number(key, int) if not isinstance(key, str) else None,
+        'preco_cobrado': _number(preco_cobrado, float),
+    }
+
+
+def parse_produtos_literal(text):
+    """Lê o texto antigo da coluna Produtos (repr de dict, com np.int64(...) e nan).
+
+    Só é usado para migrar históricos antigos; vendas novas já são gravadas tipadas.
+    """
+    if not text or not isinstance(text, str):
+        return []
+    cleaned = re.sub(r"np\.\w+\(([^()]*)\)", r"\1", text)
+    cleaned = re.sub(r"\bnan\b", "None", cleaned)
+    try:
+        products = ast.literal_eval(cleaned)
+    except (SyntaxError, ValueError) as e:
+        print(f"Ignorando produtos inválidos no histórico: {text!r} ({e})")
+        return []
+    return [sale_line_item(key, details) for key, details in products.items()]
+
+
+if __name__ == "__main__":
+    journal = SalesJournal()
+    journal.export_xlsx()
+    print(f"Histórico exportado de {journal.filepath} para Files/Historico_vendas.xlsx")
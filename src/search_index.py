@@ -0,0 +1,251 @@
+import bisect
+import math
+import threading
+import unicodedata
+from itertools import chain, islice
+
+MAX_GRAM = 3
+FIELD_SEPARATOR = '\x00'  # Nunca aparece em uma busca, então nenhum termo "atravessa" dois campos
+
+
+def strip_accents(text):
+    text = unicodedata.normalize('NFD', text) \
+        .encode('ascii', 'ignore') \
+        .decode("utf-8")
+
+    return str(text)
+
+
+def normalize(text):
+    return strip_accents(str(text)).lower()
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def to_price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def row_haystack(barcode, categoria, sabor, preco):
+    """Texto pesquisável de uma linha (campos separados por FIELD_SEPARATOR)."""
+    fields = [normalize(barcode).strip(), normalize(categoria), normalize(sabor)]
+    if not is_missing(preco):
+        # Mesmo texto que str(preco) usado antes, mais a forma com duas casas (campo próprio, sem espaço entre elas)
+        fields.extend([f"{preco}", f"{preco:.2f}"])
+    return FIELD_SEPARATOR.join(fields)
+
+
+def haystack_grams(haystack):
+    """(n-gramas, n-gramas que começam uma palavra) do texto."""
+    grams = {}
+    prefixes = {}
+    for i in range(len(haystack)):
+        token_start = i == 0 or not haystack[i - 1].isalnum()
+        for n in range(1, MAX_GRAM + 1):
+            gram = haystack[i:i + n]
+            if len(gram) < n or FIELD_SEPARATOR in gram:
+                break
+            grams[gram] = None
+            if token_start:
+                prefixes[gram] = None
+    return grams, prefixes
+
+
+def starts_token(haystack, term):
+    """True se `term` aparece no início de alguma palavra do texto."""
+    i = haystack.find(term)
+    while i != -1:
+        if i == 0 or not haystack[i - 1].isalnum():
+            return True
+        i = haystack.find(term, i + 1)
+    return False
+
+
+class SearchIndex:
+    """Índice de n-gramas (1 a 3 caracteres) sobre código, categoria, sabor e preço de uma loja.
+
+    As listas guardam o rótulo da linha no DataFrame (não a posição), então
+    editar, incluir ou apagar uma linha só mexe nas listas dos n-gramas
+    dela (update_row/remove_row); a montagem completa fica para cargas do
+    catálogo. Termos de até 3 caracteres são respondidos direto pela lista
+    do n-grama; termos maiores intersectam as listas dos trigramas e
+    confirmam com uma busca de substring. Resultados que começam uma palavra
+    vêm primeiro, depois a ordem do catálogo.
+    """
+
+    def __init__(self, df, shop, version=None):
+        import pandas as pd  # Só quem monta o índice (thread de carga/busca) precisa do pandas
+        self.shop = shop
+        self.version = version
+        self.haystacks = {}  # rótulo -> texto pesquisável
+        self.grams = {}      # n-grama -> rótulos (ordenados) que contêm o n-grama
+        self.prefixes = {}   # n-grama -> rótulos (ordenados) onde uma palavra começa com ele
+        self.prefix_sets = {}
+
+        if df.empty:
+            return
+
+        prices = pd.to_numeric(df[(shop, 'Preco')], errors='coerce') if (shop, 'Preco') in df.columns \
+            else pd.Series(float('nan'), index=df.index)
+        columns = zip(
+            df.index,
+            df[('Todas', 'Codigo de Barras')].fillna(''),
+            df[('Todas', 'Categoria')].fillna(''),
+            df[('Todas', 'Sabor')].fillna(''),
+            prices
+        )
+        # Montagem em ordem de rótulo: as listas já saem ordenadas com append
+        for label, barcode, categoria, sabor, preco in sorted(columns, key=lambda row: row[0]):
+            haystack = row_haystack(barcode, categoria, sabor, preco)
+            self.haystacks[label] = haystack
+            grams, prefixes = haystack_grams(haystack)
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(label)
+            for gram in prefixes:
+                self.prefixes.setdefault(gram, []).append(label)
+
+    def update_row(self, label, barcode, categoria, sabor, preco, version=None):
+        """Reindexa uma linha (nova ou editada) sem remontar o índice."""
+        self.remove_row(label)
+        haystack = row_haystack('' if is_missing(barcode) else barcode, '' if is_missing(categoria) else categoria,
+                                '' if is_missing(sabor) else sabor, to_price(preco))
+        self.haystacks[label] = haystack
+        grams, prefixes = haystack_grams(haystack)
+        for gram in grams:
+            bisect.insort(self.grams.setdefault(gram, []), label)
+        for gram in prefixes:
+            bisect.insort(self.prefixes.setdefault(gram, []), label)
+            self.prefix_sets.pop(gram, None)
+        if version is not None:
+            self.version = version
+
+    def remove_row(self, label, version=None):
+        """Tira uma linha do índice (apagada do catálogo)."""
+        haystack = self.haystacks.pop(label, None)
+        if haystack is not None:
+            grams, prefixes = haystack_grams(haystack)
+            for gram in grams:
+                self.grams[gram].remove(label)
+            for gram in prefixes:
+                self.prefixes[gram].remove(label)
+                self.prefix_sets.pop(gram, None)
+        if version is not None:
+            self.version = version
+
+    def prefix_set(self, gram):
+        if gram not in self.prefix_sets:
+            self.prefix_sets[gram] = frozenset(self.prefixes.get(gram, ()))
+        return self.prefix_sets[gram]
+
+    def matches(self, term):
+        """Retorna (iterador de rótulos ranqueados, total) para o termo já normalizado."""
+        if len(term) <= MAX_GRAM:
+            # Gerado sob demanda: só o trecho pedido (top-k/página) é percorrido
+            contains = self.grams.get(term, [])
+            prefix_set = self.prefix_set(term)
+            ranked = chain(self.prefixes.get(term, []),
+                           (position for position in contains if position not in prefix_set))
+            return ranked, len(contains)
+
+        posting_lists = sorted(
+            (self.grams.get(term[i:i + MAX_GRAM], []) for i in range(len(term) - MAX_GRAM + 1)),
+            key=len
+        )
+        if not posting_lists[0]:
+            return iter(()), 0
+        candidates = set(posting_lists[0])
+        for postings in posting_lists[1:]:
+            candidates.intersection_update(postings)
+            if not candidates:
+                return iter(()), 0
+
+        found = [position for position in sorted(candidates) if term in self.haystacks[position]]
+        ranked = sorted(found, key=lambda position: not starts_token(self.haystacks[position], term))
+        return iter(ranked), len(found)
+
+    def search(self, search_term, limit=None, offset=0):
+        """Top-k rótulos (para df.loc) que casam com o termo, mais o total de resultados."""
+        term = normalize(search_term).replace(',', '.')
+        if not term or FIELD_SEPARATOR in term:
+            return [], 0
+        ranked, total = self.matches(term)
+        end = None if limit is None else offset + limit
+        return list(islice(ranked, offset, end)), total
+
+
+class BackgroundSearch:
+    """Pipeline de busca fora da thread do Tk.
+
+    As teclas são agrupadas (debounce) e só o termo mais recente é enviado a
+    uma thread de trabalho. Cada envio recebe uma geração; resultados de uma
+    geração antiga são descartados, tanto na thread quanto ao chegar no Tk.
+    Os resultados voltam ao Tk pela fila de eventos (`events.post`). Tudo o
+    que a consulta precisa ler do Tk (ex.: a loja) vai junto do termo, lido
+    na thread do Tk no momento do envio.
+    """
+
+    def __init__(self, root, events, run_query, on_result, debounce_ms=150):
+        self.root = root
+        self.events = events
+        self.run_query = run_query
+        self.on_result = on_result
+        self.debounce_ms = debounce_ms
+        self.after_id = None
+        self.generation = 0
+        self.latest = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def request(self, term, *args):
+        """Chamado no Tk a cada tecla: reinicia a contagem do debounce."""
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.after_id = self.root.after(self.debounce_ms, self.submit, term, *args)
+
+    def submit(self, term, *args):
+        self.after_id = None
+        with self.condition:
+            self.generation += 1
+            self.latest = (self.generation, term, args)
+            self.condition.notify()
+
+    def cancel(self):
+        """Descarta a busca agendada e qualquer resultado ainda em andamento."""
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+        with self.condition:
+            self.generation += 1
+            self.latest = None
+
+    def is_current(self, generation):
+        with self.condition:
+            return generation == self.generation
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.latest is None:
+                    self.condition.wait()
+                generation, term, args = self.latest
+                self.latest = None
+
+            try:
+                result = self.run_query(term, *args)
+            except Exception as e:
+                print(f"Erro na busca: {e}")
+                continue
+
+            if self.is_current(generation):
+                self.events.post(self.deliver, generation, term, result, key="search_result")
+
+    def deliver(self, generation, term, result):
+        # Pode ter chegado uma tecla nova enquanto o resultado vinha para o Tk
+        if self.is_current(generation):
+            self.on_result(term, result)
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Ligado com LOLLA_STARTUP_PROFILE=1 ou `python main.py --perfil-inicio`
+ENABLED = os.environ.get("LOLLA_STARTUP_PROFILE", "") not in ("", "0") or "--perfil-inicio" in sys.argv
+
+START = time.perf_counter()
+phases = []  # (etapa, segundos)
+first_window = None  # Segundos até a janela de lojas aparecer
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'requests', 'qrcode', 'PIL')
+heavy_at_first_window = None  # Módulos pesados já importados quando a janela de lojas apareceu
+
+
+@contextmanager
+def phase(name):
+    """Mede uma etapa da abertura do programa."""
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases.append((name, time.perf_counter() - begin))
+
+
+def record(name, seconds):
+    """Registra uma etapa medida em outra thread (ex.: carga do catálogo)."""
+    if seconds is not None:
+        phases.append((name, seconds))
+
+
+def mark_first_window():
+    global first_window, heavy_at_first_window
+    if first_window is None:
+        first_window = time.perf_counter() - START
+        heavy_at_first_window = loaded_heavy_modules()
+
+
+def loaded_heavy_modules():
+    return sorted(name for name in HEAVY_MODULES if name in sys.modules)
+
+
+def report():
+    """Imprime quanto cada etapa levou (o tempo esperando o operador escolher a loja não entra)."""
+    if not ENABLED:
+        return
+    print("Tempo de abertura:")
+    for name, seconds in phases:
+        print(f"  {name:<28}{seconds * 1000:>9.1f} ms")
+    if first_window is not None:
+        print(f"  {'até a janela de lojas':<28}{first_window * 1000:>9.1f} ms")
+    if heavy_at_first_window is not None:
+        print(f"  módulos pesados antes da janela de lojas: {', '.join(heavy_at_first_window) or 'nenhum'}")
+    print(f"  módulos pesados carregados: {', '.join(loaded_heavy_modules()) or 'nenhum'}")
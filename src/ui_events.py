@@ -0,0 +1,53 @@
+import itertools
+import threading
+
+
+class UIEventQueue:
+    """Fila central de eventos para a thread do Tk.
+
+    Threads de trabalho (pagamentos, busca, gravação do catálogo) nunca
+    chamam o Tk direto: elas fazem `post(callback, *args)` e a thread do Tk
+    executa tudo em ordem a cada `interval_ms`, via root.after. Eventos com
+    a mesma `key` são agrupados: só o mais recente roda, na posição do
+    primeiro (ex.: uma rajada de status vira uma única atualização).
+    """
+
+    def __init__(self, root, interval_ms=30):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.lock = threading.Lock()
+        self.pending = {}  # key -> (callback, args); dict mantém a ordem de chegada
+        self.counter = itertools.count()
+        self.after_id = None
+
+    def post(self, callback, *args, key=None):
+        """Agenda `callback(*args)` na thread do Tk. Pode ser chamado de qualquer thread."""
+        with self.lock:
+            if key is None:
+                key = next(self.counter)
+            self.pending[key] = (callback, args)
+
+    def start(self):
+        if self.after_id is None:
+            self.after_id = self.root.after(self.interval_ms, self.pump)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def drain(self):
+        """Executa os eventos pendentes (somente na thread do Tk)."""
+        with self.lock:
+            events = list(self.pending.values())
+            self.pending = {}
+
+        for callback, args in events:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Erro ao processar evento da interface: {e}")
+
+    def pump(self):
+        self.drain()
+        self.after_id = self.root.after(self.interval_ms, self.pump)